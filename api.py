@@ -1,21 +1,39 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
+import json
 import uuid
-import psycopg2
-import os
+import psycopg
 from dotenv import load_dotenv
-from psycopg2.extras import RealDictCursor
-from graph import build_graph
+from match_index import abump_catalog_version
+from psycopg.rows import dict_row
+from job_queue import aenqueue_job, aenqueue_jobs
+import llm_cache
+from processing import astream_quotation_graph, persist_quotation_result, mark_quotation_failed
+from db import get_async_connection, close_async_pool
+import metrics
+from profiling import should_profile, find_profile
 
 load_dotenv()
 
 app = FastAPI(title="Renovation Quotation Agent API")
 
+@app.on_event("shutdown")
+async def shutdown():
+    await close_async_pool()
+
 # --- Models ---
 class QuotationRequest(BaseModel):
     transcript: str
     tenant_name: str = "Homeez"
+    property_type: Optional[str] = None # HDB / Condo / Landed; narrows price list matching
+
+class BatchQuotationRequest(BaseModel):
+    transcripts: List[str]
+    tenant_name: str = "Homeez"
+    property_type: Optional[str] = None
 
 class ResolveRequest(BaseModel):
     suspense_text: str
@@ -26,168 +44,199 @@ class QuotationResponse(BaseModel):
     quotation_id: str
     status: str
 
-# --- DB Helper ---
-def get_db_connection():
-    return psycopg2.connect(os.getenv("DATABASE_URL"))
-
-# --- Background Task ---
-def process_quotation(quotation_id: str, transcript: str, tenant_name: str):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        # 1. Get Tenant ID
-        cur.execute("SELECT id FROM tenants WHERE name = %s", (tenant_name,))
-        res = cur.fetchone()
-        if not res:
-            # Create if not exists for API convenience? Or fail? 
-            # Let's fail for now to be safe, or default.
-            print(f"Tenant {tenant_name} not found.")
-            return
-        tenant_id = str(res[0])
-        
-        # 2. Run Graph
-        app_graph = build_graph()
-        inputs = {
-            "raw_items": [transcript], 
-            # Phase 5: Pass full transcript to Extractor Node
-            "tenant_id": tenant_id,
-            "session_id": str(uuid.uuid4())
-        }
-        
-        result = app_graph.invoke(inputs)
-        
-        # 3. Save Results (Quotations Table)
-        quotation = result.get('quotation')
-        total_amount = quotation.total_amount if quotation else 0.0
-        
-        # Update status to completed
-        cur.execute("""
-            UPDATE quotations 
-            SET total_amount = %s, status = 'completed' 
-            WHERE id = %s
-        """, (total_amount, quotation_id))
-        
-        # Save Items (Matched)
-        matched_items = result.get('matched_items', [])
-        for item in matched_items:
-            # We need to map back to proper format
-            cur.execute("""
-                INSERT INTO quotation_items (quotation_id, price_list_id, description, quantity, unit_price, confidence_score, is_suspense)
-                VALUES (%s, %s, %s, %s, %s, %s, FALSE)
-            """, (quotation_id, item.price_list_id, item.description, item.quantity, item.unit_price, item.confidence_score))
-            
-        # Save Items (Suspense)
-        suspense_items = result.get('suspense_items', [])
-        for item in suspense_items:
-            cur.execute("""
-                INSERT INTO quotation_items (quotation_id, description, unit_price, confidence_score, is_suspense)
-                VALUES (%s, %s, 0, %s, TRUE)
-            """, (quotation_id, item.raw_text, item.confidence_score))
-            
-        conn.commit()
-        print(f"Quotation {quotation_id} processed successfully.")
-        
-    except Exception as e:
-        print(f"Error processing quotation {quotation_id}: {e}")
-        conn.rollback()
-        # Mark as failed
-        # cur.execute("UPDATE quotations SET status = 'failed' WHERE id = %s", (quotation_id,))
-        # conn.commit()
-    finally:
-        cur.close()
-        conn.close()
+class BatchQuotationResponse(BaseModel):
+    quotations: List[QuotationResponse]
 
 # --- Endpoints ---
+# Endpoints use the async (psycopg 3) pool so a slow query never blocks the event loop.
 
 @app.post("/quotation", response_model=QuotationResponse)
-async def create_quotation(req: QuotationRequest, background_tasks: BackgroundTasks):
-    conn = get_db_connection()
-    cur = conn.cursor()
+async def create_quotation(req: QuotationRequest, x_profile: Optional[str] = Header(None)):
+    # X-Profile: 1 runs this quotation under the profiler (see GET /quotation/{id}/profile)
+    profile = should_profile(x_profile in ("1", "true"))
+    async with get_async_connection() as conn:
+        async with conn.cursor() as cur:
+            # 1. Get Tenant ID
+            await cur.execute("SELECT id FROM tenants WHERE name = %s", (req.tenant_name,))
+            res = await cur.fetchone()
+            if not res:
+                raise HTTPException(status_code=404, detail=f"Tenant '{req.tenant_name}' not found")
+            tenant_id = res[0]
+            
+            # 2. Create Quotation Record
+            quotation_id = str(uuid.uuid4())
+            await cur.execute("""
+                INSERT INTO quotations (id, tenant_id, client_name, status)
+                VALUES (%s, %s, 'API User', 'processing')
+            """, (quotation_id, tenant_id))
+            
+            # 3. Queue it for the workers (same transaction, so no quotation is left without a job)
+            await aenqueue_job(cur, quotation_id, tenant_id, req.transcript, req.property_type, profile)
+            await conn.commit()
     
-    try:
-        # 1. Get Tenant ID
-        cur.execute("SELECT id FROM tenants WHERE name = %s", (req.tenant_name,))
-        res = cur.fetchone()
-        if not res:
-            raise HTTPException(status_code=404, detail=f"Tenant '{req.tenant_name}' not found")
-        tenant_id = res[0]
-        
-        # 2. Create Quotation Record
-        quotation_id = str(uuid.uuid4())
-        cur.execute("""
-            INSERT INTO quotations (id, tenant_id, client_name, status)
-            VALUES (%s, %s, 'API User', 'processing')
-        """, (quotation_id, tenant_id))
-        conn.commit()
-        
-        # 3. Trigger Background Processing
-        background_tasks.add_task(process_quotation, quotation_id, req.transcript, req.tenant_name)
-        
-        return {"quotation_id": quotation_id, "status": "processing"}
-        
-    finally:
-        cur.close()
-        conn.close()
+    return {"quotation_id": quotation_id, "status": "processing"}
+
+@app.post("/quotations/batch", response_model=BatchQuotationResponse)
+async def create_quotations_batch(req: BatchQuotationRequest):
+    """Queues N transcripts for one tenant: one tenant lookup and one transaction for all rows and jobs."""
+    if not req.transcripts:
+        raise HTTPException(status_code=400, detail="No transcripts provided")
+
+    async with get_async_connection() as conn:
+        async with conn.cursor() as cur:
+            # 1. Get Tenant ID (once for the whole batch)
+            await cur.execute("SELECT id FROM tenants WHERE name = %s", (req.tenant_name,))
+            res = await cur.fetchone()
+            if not res:
+                raise HTTPException(status_code=404, detail=f"Tenant '{req.tenant_name}' not found")
+            tenant_id = res[0]
+
+            # 2. Create Quotation Records and queue them in the same transaction
+            quotation_ids = [str(uuid.uuid4()) for _ in req.transcripts]
+            await cur.executemany("""
+                INSERT INTO quotations (id, tenant_id, client_name, status)
+                VALUES (%s, %s, 'API User', 'processing')
+            """, [(qid, tenant_id) for qid in quotation_ids])
+            await aenqueue_jobs(cur, [(qid, tenant_id, t, should_profile()) for qid, t in zip(quotation_ids, req.transcripts)],
+                                req.property_type)
+            await conn.commit()
+
+    return {"quotations": [{"quotation_id": qid, "status": "processing"} for qid in quotation_ids]}
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/quotation/stream")
+async def stream_quotation(req: QuotationRequest):
+    """
+    Runs the graph in this process and streams progress as Server-Sent Events
+    (quotation, guard, extracted, match, suspense, validation, total, done | error),
+    so clients render line items as they are decided instead of polling.
+    The result is saved exactly as a worker would save it.
+    """
+    async with get_async_connection() as conn:
+        async with conn.cursor() as cur:
+            # 1. Get Tenant ID
+            await cur.execute("SELECT id FROM tenants WHERE name = %s", (req.tenant_name,))
+            res = await cur.fetchone()
+            if not res:
+                raise HTTPException(status_code=404, detail=f"Tenant '{req.tenant_name}' not found")
+            tenant_id = res[0]
+
+            # 2. Create Quotation Record
+            quotation_id = str(uuid.uuid4())
+            await cur.execute("""
+                INSERT INTO quotations (id, tenant_id, client_name, status)
+                VALUES (%s, %s, 'API User', 'processing')
+            """, (quotation_id, tenant_id))
+            await conn.commit()
+
+    async def events():
+        yield sse("quotation", {"quotation_id": quotation_id, "status": "processing"})
+        saved = False
+        try:
+            async for event, data in astream_quotation_graph(req.transcript, tenant_id, req.property_type):
+                if event != "result":
+                    yield sse(event, data)
+                    continue
+                # 3. Persist the final state (sync psycopg2 writer, off the event loop)
+                await asyncio.to_thread(persist_quotation_result, quotation_id, data)
+                saved = True
+                quotation = data.get('quotation')
+                yield sse("done", {
+                    "quotation_id": quotation_id,
+                    "status": "completed",
+                    "total_amount": quotation.total_amount if quotation else 0.0,
+                    "error": data.get('error')
+                })
+        except Exception as e:
+            print(f"Error streaming quotation {quotation_id}: {e}")
+            yield sse("error", {"quotation_id": quotation_id, "detail": str(e)})
+        finally:
+            # Also covers the client disconnecting mid-run
+            if not saved:
+                await asyncio.to_thread(mark_quotation_failed, quotation_id)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/quotation/{quotation_id}")
 async def get_quotation(quotation_id: str):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    try:
-        # Fetch Header
-        cur.execute("SELECT * FROM quotations WHERE id = %s", (quotation_id,))
-        quotation = cur.fetchone()
-        if not quotation:
-            raise HTTPException(status_code=404, detail="Quotation not found")
+    async with get_async_connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            # Fetch Header
+            await cur.execute("SELECT * FROM quotations WHERE id = %s", (quotation_id,))
+            quotation = await cur.fetchone()
+            if not quotation:
+                raise HTTPException(status_code=404, detail="Quotation not found")
+                
+            # Fetch Items
+            await cur.execute("SELECT * FROM quotation_items WHERE quotation_id = %s", (quotation_id,))
+            items = await cur.fetchall()
             
-        # Fetch Items
-        cur.execute("SELECT * FROM quotation_items WHERE quotation_id = %s", (quotation_id,))
-        items = cur.fetchall()
-        
-        return {
-            "quotation": quotation,
-            "items": items
-        }
-    finally:
-        cur.close()
-        conn.close()
+            return {
+                "quotation": quotation,
+                "items": items
+            }
+
+@app.get("/quotation/{quotation_id}/profile")
+async def get_quotation_profile(quotation_id: str):
+    """The pyinstrument HTML profile of a profiled quotation run, if this process can see PROFILE_DIR."""
+    path = find_profile(quotation_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="No profile for this quotation")
+    return FileResponse(path, media_type="text/html")
 
 @app.post("/resolve")
 async def resolve_suspense_endpoint(req: ResolveRequest):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        # Get Tenant
-        cur.execute("SELECT id FROM tenants WHERE name = %s", (req.tenant_name,))
-        res = cur.fetchone()
-        if not res:
-            raise HTTPException(404, "Tenant not found")
-        tenant_id = res[0]
-        
-        # Verify Target Item Existence
-        cur.execute("SELECT description FROM price_lists WHERE id = %s AND tenant_id = %s", (req.target_item_id, tenant_id))
-        if not cur.fetchone():
-             raise HTTPException(404, "Target price list item not found")
-
-        # Upsert Alias
-        cur.execute("""
-            INSERT INTO product_aliases (tenant_id, alias_text, price_list_id, is_verified)
-            VALUES (%s, %s, %s, TRUE)
-            ON CONFLICT (tenant_id, alias_text) 
-            DO UPDATE SET price_list_id = EXCLUDED.price_list_id, is_verified = TRUE
-        """, (tenant_id, req.suspense_text, req.target_item_id))
-        
-        conn.commit()
-        return {"message": "Alias created successfully", "text": req.suspense_text}
-        
-    except psycopg2.Error as e:
-        conn.rollback()
-        raise HTTPException(500, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
+    async with get_async_connection() as conn:
+        async with conn.cursor() as cur:
+            try:
+                # Get Tenant
+                await cur.execute("SELECT id FROM tenants WHERE name = %s", (req.tenant_name,))
+                res = await cur.fetchone()
+                if not res:
+                    raise HTTPException(404, "Tenant not found")
+                tenant_id = res[0]
+                
+                # Verify Target Item Existence
+                await cur.execute("SELECT description FROM price_lists WHERE id = %s AND tenant_id = %s AND is_active", (req.target_item_id, tenant_id))
+                if not await cur.fetchone():
+                     raise HTTPException(404, "Target price list item not found")
+
+                # Upsert Alias
+                await cur.execute("""
+                    INSERT INTO product_aliases (tenant_id, alias_text, price_list_id, is_verified)
+                    VALUES (%s, %s, %s, TRUE)
+                    ON CONFLICT (tenant_id, alias_text) 
+                    DO UPDATE SET price_list_id = EXCLUDED.price_list_id, is_verified = TRUE
+                """, (tenant_id, req.suspense_text, req.target_item_id))
+                await abump_catalog_version(cur, tenant_id)
+                
+                await conn.commit()
+                return {"message": "Alias created successfully", "text": req.suspense_text}
+                
+            except psycopg.Error as e:
+                await conn.rollback()
+                raise HTTPException(500, detail=str(e))
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """LLM cache counters: this process's hits/misses plus what is stored across all processes."""
+    async with get_async_connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(llm_cache.STORED_STATS_SQL)
+            stored = await cur.fetchall()
+    return {
+        "process": llm_cache.stats(),
+        "stored": {row['kind']: {"entries": row['entries'], "hits": row['hits']} for row in stored}
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (graph runs in this process, e.g. /quotation/stream)."""
+    body, content_type = metrics.latest()
+    return Response(content=body, media_type=content_type)
 
 if __name__ == "__main__":
     import uvicorn
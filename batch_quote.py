@@ -0,0 +1,77 @@
+import argparse
+import glob
+import json
+import os
+import time
+from dotenv import load_dotenv
+from db import get_connection
+from processing import process_batch, BATCH_MAX_WORKERS
+
+load_dotenv()
+
+# Quote many transcripts for one tenant in a single run (e.g. reprocessing
+# archived meetings after a price-list update). Results are saved like API quotations.
+#
+#   python batch_quote.py transcripts/ --tenant=Homeez --workers 8
+#   python batch_quote.py a.txt b.txt --tenant=Homeez --json results.json
+
+
+def collect_transcripts(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.txt"))))
+        else:
+            files.append(path)
+    transcripts = []
+    for f in files:
+        with open(f, encoding="utf-8") as fh:
+            transcripts.append(fh.read())
+    return files, transcripts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quote many transcripts for one tenant")
+    parser.add_argument("paths", nargs="+", help="Transcript .txt files or directories of them")
+    parser.add_argument("--tenant", default="Homeez", help="Tenant name")
+    parser.add_argument("--workers", type=int, default=BATCH_MAX_WORKERS, help="Graph runs in parallel")
+    parser.add_argument("--client-name", default="Batch")
+    parser.add_argument("--property-type", help="HDB / Condo / Landed; narrows price list matching")
+    parser.add_argument("--json", help="Also write the per-transcript results to this file")
+    args = parser.parse_args()
+
+    files, transcripts = collect_transcripts(args.paths)
+    if not transcripts:
+        print("No transcripts found.")
+        return
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM tenants WHERE name = %s", (args.tenant,))
+            res = cur.fetchone()
+    if not res:
+        print(f"Error: Tenant '{args.tenant}' not found.")
+        return
+
+    print(f"Quoting {len(transcripts)} transcript(s) for {args.tenant} with {args.workers} worker(s)...")
+    start = time.perf_counter()
+    results = process_batch(transcripts, res[0], client_name=args.client_name, max_workers=args.workers,
+                            property_type=args.property_type)
+    elapsed = time.perf_counter() - start
+
+    print("\n--- RESULTS ---")
+    for path, r in zip(files, results):
+        line = f"  {os.path.basename(path)}: {r['status']} {r['quotation_id']} ${r['total_amount']:,.2f}"
+        if r['error']:
+            line += f" ({r['error']})"
+        print(line)
+    completed = sum(1 for r in results if r['status'] == 'completed')
+    print(f"\n{completed}/{len(results)} completed in {elapsed:.1f}s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump([dict(r, file=path) for path, r in zip(files, results)], fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
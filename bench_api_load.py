@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+# Load test: latency of GET /quotation/{id} while POST /quotation traffic runs concurrently.
+# Start the API first (python api.py), then:
+#
+#   python bench_api_load.py --url http://localhost:8000 --duration 30 --readers 50 --writers 10
+#
+# Run it once against the previous (blocking psycopg2) build and once against the
+# current one to compare p99. Every POST queues a real quotation, so point it at a
+# tenant/environment where LLM spend is acceptable (or a replay LLM setup).
+
+SAMPLE_TRANSCRIPT = "I want to hack the kitchen wall and do vinyl flooring for the living room."
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+async def writer(client, tenant, deadline, latencies, errors):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            r = await client.post("/quotation", json={"transcript": SAMPLE_TRANSCRIPT, "tenant_name": tenant})
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            errors.append(1)
+
+
+async def reader(client, quotation_id, deadline, latencies, errors):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            r = await client.get(f"/quotation/{quotation_id}")
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            errors.append(1)
+
+
+def report(name, latencies, errors, duration):
+    ms = [l * 1000 for l in latencies]
+    print(f"{name:<22} n={len(ms):<6} rps={len(ms) / duration:7.1f} errors={len(errors):<4} "
+          f"p50={percentile(ms, 50):7.1f}ms p95={percentile(ms, 95):7.1f}ms "
+          f"p99={percentile(ms, 99):7.1f}ms mean={statistics.fmean(ms) if ms else 0:7.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="GET /quotation latency under concurrent POST /quotation load")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--tenant", default="Homeez")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--readers", type=int, default=50)
+    parser.add_argument("--writers", type=int, default=10)
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.readers + args.writers)
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        # Seed one quotation to read back
+        r = await client.post("/quotation", json={"transcript": SAMPLE_TRANSCRIPT, "tenant_name": args.tenant})
+        r.raise_for_status()
+        quotation_id = r.json()["quotation_id"]
+
+        get_latencies, get_errors = [], []
+        post_latencies, post_errors = [], []
+        deadline = time.monotonic() + args.duration
+
+        tasks = [writer(client, args.tenant, deadline, post_latencies, post_errors) for _ in range(args.writers)]
+        tasks += [reader(client, quotation_id, deadline, get_latencies, get_errors) for _ in range(args.readers)]
+        await asyncio.gather(*tasks)
+
+    print(f"\n{args.readers} readers / {args.writers} writers for {args.duration:.0f}s against {args.url}")
+    report("GET /quotation/{id}", get_latencies, get_errors, args.duration)
+    report("POST /quotation", post_latencies, post_errors, args.duration)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
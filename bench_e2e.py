@@ -0,0 +1,144 @@
+import argparse
+import glob
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Replayed LLM responses by default, and no LLM result cache, so every run does the same model calls
+os.environ.setdefault("LLM_MODE", "replay")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from dotenv import load_dotenv
+from db import get_connection
+from graph import get_graph
+from processing import quotation_inputs
+import llm
+
+load_dotenv()
+
+# End-to-end throughput of the compiled graph (guard, extractor, matcher, pricer,
+# validator, formatter) over the transcripts in tests/, at several concurrencies.
+# LLM calls are replayed from LLM_FIXTURES_DIR with LLM_REPLAY_LATENCY_MS of injected
+# latency, so runs are repeatable and free. The matcher needs DATABASE_URL and a
+# tenant with a price list. Record fixtures once against the real model:
+#
+#   LLM_MODE=record python bench_e2e.py --quotations 2 --concurrency 1
+#   LLM_REPLAY_LATENCY_MS=800 python bench_e2e.py --quotations 100 --concurrency 1 4 16
+#   LLM_REPLAY_LATENCY_MS=recorded python bench_e2e.py
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Collects wall time per graph node from LangChain callbacks (node runs carry a graph:step tag)."""
+
+    def __init__(self):
+        self.timings = {}
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, tags=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node and any(t.startswith("graph:step:") for t in tags or []):
+            with self._lock:
+                self._started[run_id] = (node, time.perf_counter())
+
+    def _finish(self, run_id):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started:
+                node, start = started
+                self.timings.setdefault(node, []).append((time.perf_counter() - start) * 1000)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+
+def load_transcripts(pattern):
+    transcripts = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding="utf-8") as fh:
+            transcripts.append((os.path.basename(path), fh.read()))
+    return transcripts
+
+
+def run_level(app, transcripts, tenant_id, property_type, quotations, concurrency):
+    timer = NodeTimer()
+    config = {"callbacks": [timer]}
+
+    def run(i):
+        name, transcript = transcripts[i % len(transcripts)]
+        start = time.perf_counter()
+        try:
+            state = app.invoke(quotation_inputs(transcript, tenant_id, property_type), config=config)
+            # A run that quoted nothing (e.g. every LLM call failed and a node fell back) is not a success
+            error = state.get("error") or (None if state.get("matched_items") or state.get("suspense_items")
+                                           else "no items quoted")
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return (time.perf_counter() - start) * 1000, name, error
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(run, range(quotations)))
+    return time.perf_counter() - start, outcomes, timer.timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end quotations/second of the compiled graph")
+    parser.add_argument("--transcripts", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "*.txt"))
+    parser.add_argument("--tenant", default="Homeez", help="Tenant name")
+    parser.add_argument("--property-type", help="HDB / Condo / Landed")
+    parser.add_argument("--quotations", type=int, default=40, help="Graph runs per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    transcripts = load_transcripts(args.transcripts)
+    if not transcripts:
+        print(f"No transcripts match {args.transcripts}")
+        return
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM tenants WHERE name = %s", (args.tenant,))
+            res = cur.fetchone()
+    if not res:
+        print(f"Error: Tenant '{args.tenant}' not found.")
+        return
+
+    # formatter_node writes quotation_summary.md into the working directory
+    os.chdir(tempfile.mkdtemp())
+    app = get_graph()
+    print(f"LLM_MODE={llm.LLM_MODE}, replay latency {llm.LLM_REPLAY_LATENCY_MS} ms, "
+          f"{len(transcripts)} transcript(s): {', '.join(name for name, _ in transcripts)}")
+
+    # One untimed pass to load the match index and guard rules
+    run_level(app, transcripts, res[0], args.property_type, len(transcripts), 1)
+
+    for concurrency in args.concurrency:
+        elapsed, outcomes, timings = run_level(app, transcripts, res[0], args.property_type,
+                                               args.quotations, concurrency)
+        latencies = [ms for ms, _, _ in outcomes]
+        errors = {}
+        for _, name, error in outcomes:
+            if error:
+                errors.setdefault(f"{name}: {error}", 0)
+                errors[f"{name}: {error}"] += 1
+
+        print(f"\nconcurrency {concurrency}: {len(outcomes)} quotations in {elapsed:.2f}s = "
+              f"{len(outcomes) / elapsed:.2f} quotations/s, latency p50 {np.percentile(latencies, 50):.0f} ms "
+              f"p99 {np.percentile(latencies, 99):.0f} ms")
+        for error, count in errors.items():
+            print(f"  {count}x {error[:120]}")
+        print(f"  {'node':<16} {'calls':>6} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+        for node, values in timings.items():
+            print(f"  {node:<16} {len(values):>6} {np.mean(values):9.1f} {np.percentile(values, 50):9.1f} "
+                  f"{np.percentile(values, 99):9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import tempfile
+import time
+
+# Keep the run off the database: the LLM result cache would otherwise be consulted
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_google_genai import ChatGoogleGenerativeAI
+import llm
+from graph import build_graph, get_graph, reset_graph
+from nodes.guard import GUARD_MODEL
+from nodes.extractor import EXTRACTOR_MODEL
+
+# Micro-benchmark: per-quotation framework overhead, excluding model time.
+# LLM calls are served by fake chat models, the LLM cache is off and the
+# extractor returns no items, so the run never touches the database or the network.
+#
+#   python bench_graph.py --runs 200
+
+
+def per_call(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-quotation graph overhead excluding model time")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    # Client construction only validates the key, it is never used for a request here
+    os.environ.setdefault("GOOGLE_API_KEY", "bench-placeholder")
+    # formatter_node writes quotation_summary.md into the working directory
+    os.chdir(tempfile.mkdtemp())
+
+    compile_ms = per_call(build_graph, args.runs)
+    reset_graph()
+    get_graph()
+    cached_compile_ms = per_call(get_graph, args.runs)
+
+    client_ms = per_call(lambda: (ChatGoogleGenerativeAI(model=GUARD_MODEL, temperature=0),
+                                  ChatGoogleGenerativeAI(model=EXTRACTOR_MODEL, temperature=0)), args.runs)
+    llm.reset_llms()
+    llm.get_llm(GUARD_MODEL)
+    llm.get_llm(EXTRACTOR_MODEL)
+    cached_client_ms = per_call(lambda: (llm.get_llm(GUARD_MODEL), llm.get_llm(EXTRACTOR_MODEL)), args.runs)
+
+    llm.set_llm(GUARD_MODEL, FakeListChatModel(responses=["SAFE"]))
+    llm.set_llm(EXTRACTOR_MODEL, FakeListChatModel(responses=["[]"]))
+    inputs = {"raw_items": ["I want to hack the kitchen wall."], "tenant_id": "bench", "session_id": "bench"}
+    app = get_graph()
+    invoke_ms = per_call(lambda: app.invoke(inputs), args.runs)
+
+    before = compile_ms + client_ms + invoke_ms
+    after = cached_compile_ms + cached_client_ms + invoke_ms
+    print(f"\n{'':<28} {'per call (ms)':>14}")
+    print(f"{'build_graph()':<28} {compile_ms:14.3f}")
+    print(f"{'get_graph() (cached)':<28} {cached_compile_ms:14.3f}")
+    print(f"{'2x ChatGoogleGenerativeAI()':<28} {client_ms:14.3f}")
+    print(f"{'2x get_llm() (cached)':<28} {cached_client_ms:14.3f}")
+    print(f"{'graph.invoke (fake LLMs)':<28} {invoke_ms:14.3f}")
+    print(f"\nOverhead per quotation: {before:.3f} ms before -> {after:.3f} ms after")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import random
+import re
+import time
+from guard_rules import DEFAULT_RULES, PatternScanner
+
+# Heuristic guard throughput on large transcripts: the old per-pattern loop
+# (one re.search over the whole transcript per rule) vs the single-pass
+# PatternScanner, for growing rule sets. Pure CPU, no DB or network.
+#
+#   python bench_guard.py --mb 2 8 --rules 7 50 200
+
+
+FILLER = [
+    "Can you hack the kitchen wall and replaster it.",
+    "Master bedroom wardrobe, about 8 feet, laminate finish.",
+    "Eh the toilet floor need to redo, hacking and tiling.",
+    "Paint whole house, two coats, ceiling also.",
+    "Yah the false ceiling in living room with cove light.",
+]
+
+
+def make_transcript(size_bytes, inject=None, seed=0):
+    rng = random.Random(seed)
+    lines, size = [], 0
+    while size < size_bytes:
+        line = f"[{len(lines):06d}] {rng.choice(FILLER)}"
+        lines.append(line)
+        size += len(line) + 1
+    if inject:
+        lines.append(inject)
+    return "\n".join(lines)
+
+
+def make_rules(n, seed=0):
+    """Default rules padded with synthetic phrase rules of the same shape."""
+    rng = random.Random(seed)
+    words = ["bypass", "reveal", "prompt", "admin", "unlock", "secret", "override", "persona", "token", "jailbreak"]
+    rules = list(DEFAULT_RULES)
+    while len(rules) < n:
+        phrase = " ".join(rng.sample(words, 3))
+        rules.append((f"synthetic_{len(rules)}", phrase))
+    return rules[:n]
+
+
+def loop_scan(rules, text):
+    for name, pattern in rules:
+        m = re.search(pattern, text, re.IGNORECASE)
+        if m:
+            return name, m.start()
+    return None
+
+
+def timed(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = fn()
+    return (time.perf_counter() - start) / runs * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Heuristic guard scan time, per-pattern loop vs single pass")
+    parser.add_argument("--mb", type=float, nargs="+", default=[1, 4])
+    parser.add_argument("--rules", type=int, nargs="+", default=[7, 50, 200])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'rules':>6} {'case':>6} {'loop (ms)':>10} {'scanner (ms)':>13} {'speedup':>8}")
+    for mb in args.mb:
+        clean = make_transcript(int(mb * 1024 * 1024))
+        # Worst case for the loop: the only hit is the last rule, at the end
+        for n in args.rules:
+            rules = make_rules(n)
+            scanner = PatternScanner(rules)
+            injected = clean + "\n" + rules[-1][1].upper()
+            for case, text in (("clean", clean), ("hit", injected)):
+                loop_ms, loop_hit = timed(lambda: loop_scan(rules, text), args.runs)
+                scan_ms, scan_hit = timed(lambda: scanner.scan(text), args.runs)
+                assert (loop_hit is None) == (scan_hit is None)
+                print(f"{mb:>6.1f}MB {n:>6} {case:>6} {loop_ms:10.1f} {scan_ms:13.1f} {loop_ms / scan_ms:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
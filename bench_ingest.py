@@ -0,0 +1,134 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+import pandas as pd
+from psycopg2.extras import execute_values
+from ingest_excel import (read_price_list, parse_price_list, insert_price_list_items,
+                          NEW_FORMAT_COLUMNS, OLD_FORMAT_COLUMNS, RECORD_FIELDS, VARIANT_FIELDS)
+
+# Price list parsing (and optionally loading) at catalogue scale: the old
+# per-row iterrows parser vs the column-wise parse_price_list, on a synthetic
+# N-row copy of homeez_price_list_actual.csv.
+#
+#   python bench_ingest.py --rows 100000
+#   python bench_ingest.py --rows 100000 --load     # also time INSERT vs COPY (needs DATABASE_URL; rolled back)
+
+
+def make_synthetic_csv(source, rows, seed=0):
+    """Writes a CSV with the source's two preamble lines and header, and `rows` varied data rows."""
+    rng = random.Random(seed)
+    with open(source, encoding="utf-8") as fh:
+        preamble = [fh.readline() for _ in range(2)]
+    base = pd.read_csv(source, header=2, dtype=str)
+    base = base[base['Name'].notna() & base['Price'].notna()]
+
+    sample = base.sample(n=rows, replace=True, random_state=seed).reset_index(drop=True)
+    # Distinct descriptions, a spread of price formats, a few blanks and duplicates like the real sheets
+    sample['Name'] = [f"{name.strip()} (variant {i})" for i, name in enumerate(sample['Name'])]
+    prices = []
+    for p in sample['Price']:
+        value = float(str(p).replace('$', '').replace(',', '') or 0) * rng.uniform(0.8, 1.2)
+        style = rng.random()
+        prices.append(f"${value:,.2f}" if style < 0.3 else ("TBC" if style < 0.32 else f"{value:.2f}"))
+    sample['Price'] = prices
+    dupes = sample.sample(frac=0.02, random_state=seed)
+    sample = pd.concat([sample, dupes], ignore_index=True)
+
+    path = os.path.join(tempfile.mkdtemp(), "synthetic_price_list.csv")
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.writelines(preamble)
+        sample.to_csv(fh, index=False)
+    return path
+
+
+def parse_price_list_iterrows(df):
+    """Row-by-row version of parse_price_list (the pre-vectorization approach), kept as the baseline."""
+    new_format = 'Service_Category' in df.columns
+    mapping = NEW_FORMAT_COLUMNS if new_format else OLD_FORMAT_COLUMNS
+    columns = {field: col for col, field in mapping.items()}
+
+    def text(value, default):
+        if value is None or pd.isna(value):
+            return default
+        value = " ".join(str(value).split())
+        return value or default
+
+    records = []
+    seen = set()
+    for _, row in df.iterrows():
+        get = lambda field: row.get(columns[field]) if field in columns else None
+        description, price = get('description'), get('price')
+        if pd.isna(description) or pd.isna(price):
+            continue
+        description = str(description).strip()
+        variant = tuple(text(get(f), 'All') for f in VARIANT_FIELDS)
+        if (description,) + variant in seen:
+            continue
+        seen.add((description,) + variant)
+        try:
+            unit_price = float(str(price).replace('$', '').replace(',', '').strip())
+        except ValueError:
+            unit_price = 0.0
+        category, unit, item_code = get('category'), get('unit'), get('item_code')
+        records.append((
+            category if not pd.isna(category) else 'General',
+            description,
+            unit if not pd.isna(unit) else 'lot',
+            unit_price,
+            str(item_code).strip() if item_code is not None and not pd.isna(item_code) else None,
+            *variant,
+            text(get('sub_category'), None),
+            text(get('work_description'), None)
+        ))
+    return records
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def bench_load(records):
+    from db import get_connection
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO tenants (name) VALUES (%s) RETURNING id", (f"bench-{time.time()}",))
+            tenant_id = str(cur.fetchone()[0])
+            insert_s, _ = timed(lambda: execute_values(cur, """
+                INSERT INTO price_lists (tenant_id, {})
+                VALUES %s
+            """.format(", ".join(RECORD_FIELDS)), [(tenant_id,) + r for r in records]))
+            cur.execute("DELETE FROM price_lists WHERE tenant_id = %s", (tenant_id,))
+            copy_s, _ = timed(lambda: insert_price_list_items(cur, tenant_id, records))
+        conn.rollback()
+    return insert_s, copy_s
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price list parse/load time at catalogue scale")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--source", default="homeez_price_list_actual.csv")
+    parser.add_argument("--load", action="store_true", help="Also time execute_values vs COPY against the database")
+    args = parser.parse_args()
+
+    path = make_synthetic_csv(args.source, args.rows)
+    read_s, df = timed(lambda: read_price_list(path))
+    old_s, old_records = timed(lambda: parse_price_list_iterrows(df))
+    new_s, new_records = timed(lambda: parse_price_list(df))
+    assert old_records == new_records, "vectorized parser output differs from the iterrows baseline"
+
+    print(f"\n{len(df)} rows -> {len(new_records)} items")
+    print(f"{'read_csv':<28} {read_s:8.2f}s")
+    print(f"{'parse (iterrows)':<28} {old_s:8.2f}s")
+    print(f"{'parse (vectorized)':<28} {new_s:8.2f}s   {old_s / new_s:.1f}x")
+    if args.load:
+        insert_s, copy_s = bench_load(new_records)
+        print(f"{'load (execute_values)':<28} {insert_s:8.2f}s")
+        print(f"{'load (COPY)':<28} {copy_s:8.2f}s   {insert_s / copy_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+from ingest_excel import read_price_list, parse_price_list, insert_price_list_items, RECORD_FIELDS
+from match_index import MatchIndex, MATCH_CANDIDATE_K, MATCH_TFIDF_BLEND
+from nodes.matcher import CONFIDENCE_THRESHOLD, match_with_index, match_pg_trgm
+from bench_matcher import perturb
+
+# Matcher accuracy and latency on a labelled gold set, for every backend, at
+# the real price list size and synthetic scale-ups. In memory by default;
+# --pg also runs the pg_trgm backend against a throwaway tenant (rolled back).
+# Use --json to keep a result file to compare across releases.
+#
+#   python bench_match_quality.py --rows 0 10000 100000 --json matcher_bench.json
+#   python bench_match_quality.py --rows 0 --threshold 95      # what would a lower threshold do?
+#
+# Gold set (tests/matcher_gold.jsonl), one query per line:
+#   {"query": "hack kitchen wall tiles", "expected": "<price list description>" or null,
+#    "property_type": "HDB" or null, "location": "Kitchen" or null}
+# "expected": null marks work that is not in the price list and should go to suspense.
+
+
+def load_gold(path):
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def load_records(source):
+    return parse_price_list(read_price_list(source))
+
+
+def scale_up_records(records, rows, rng):
+    """Pads the real price list to `rows` items with suffixed copies of real items (same variants)."""
+    rooms = ["Kitchen", "Toilet", "Bedroom", "Living Room", "Balcony", "Study", "Service Yard", "Foyer"]
+    types = ["HDB", "Condo", "Landed", "EA", "EM", "3-Gen"]
+    description = RECORD_FIELDS.index('description')
+    scaled = list(records)
+    seen = {r[description] for r in records}
+    while len(scaled) < rows:
+        base = list(rng.choice(records))
+        base[description] = f"{base[description]} - {rng.choice(rooms)} ({rng.choice(types)} Type {rng.randint(1, 999)})"
+        if base[description] not in seen:
+            seen.add(base[description])
+            scaled.append(tuple(base))
+    return scaled
+
+
+def synthetic_queries(records, n, rng):
+    """Perturbed phrasings of random catalogue items, labelled with their source (no filters)."""
+    description = RECORD_FIELDS.index('description')
+    picks = [rng.choice(records)[description] for _ in range(n)]
+    return [{"query": perturb(d, rng), "expected": d, "property_type": None, "location": None} for d in picks]
+
+
+def memory_backends(index, candidate_k, blend):
+    """name -> extract(queries, limit=, mask=) for the in-memory backends."""
+    return {
+        "fuzzy": lambda queries, limit, mask: index.extract_batch(queries, limit=limit, candidate_k=0, mask=mask),
+        f"fuzzy_k{candidate_k}": lambda queries, limit, mask: index.extract_batch(queries, limit=limit, candidate_k=candidate_k, mask=mask),
+        "tfidf": lambda queries, limit, mask: index.extract_tfidf(queries, limit=limit, mask=mask, blend=blend),
+    }
+
+
+def run_queries(match_one, queries):
+    """Matches each query on its own (one quotation item); returns (best matches, latencies in ms)."""
+    best, latencies = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, matches = match_one(q)
+        latencies.append((time.perf_counter() - start) * 1000)
+        best.append(matches[0][0] if matches and matches[0] else None)
+    return best, latencies
+
+
+def score(queries, best, latencies, threshold):
+    """precision@1 over labelled queries, suspense rate, auto-match precision and latency percentiles."""
+    labelled = [(q, b) for q, b in zip(queries, best) if q['expected']]
+    unlabelled = [b for q, b in zip(queries, best) if not q['expected']]
+    correct = lambda q, b: b is not None and b[2]['description'] == q['expected']
+    auto = [(q, b) for q, b in labelled if b and b[1] >= threshold]
+    suspense = sum(1 for b in best if not b or b[1] < threshold)
+    return {
+        "queries": len(queries),
+        "precision_at_1": round(sum(correct(q, b) for q, b in labelled) / len(labelled), 4) if labelled else None,
+        "suspense_rate": round(suspense / len(queries), 4) if queries else None,
+        "auto_match_precision": round(sum(correct(q, b) for q, b in auto) / len(auto), 4) if auto else None,
+        "false_match_rate": round(sum(1 for b in unlabelled if b and b[1] >= threshold) / len(unlabelled), 4) if unlabelled else None,
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "latency_p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def traced(fn):
+    """Runs fn under tracemalloc; returns (result, peak MiB, retained MiB)."""
+    tracemalloc.start()
+    try:
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak / 2**20, current / 2**20
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def bench_memory(records, query_sets, args):
+    # Loaded up front so the tfidf build time doesn't include the import
+    import sklearn.feature_extraction.text  # noqa: F401
+    items = [dict(zip(RECORD_FIELDS, r), id=i) for i, r in enumerate(records)]
+    build_index = lambda: MatchIndex("bench", 0, items, [])
+    # Built twice: timed untraced, and again under tracemalloc (which slows Python code) for memory
+    index, index_s = timed(build_index)
+    traced_index, index_peak, index_mb = traced(build_index)
+    results = []
+    for name, extract in memory_backends(index, args.k, args.blend).items():
+        build = {"build_s": round(index_s, 3), "build_peak_mb": round(index_peak, 1), "index_mb": round(index_mb, 1)}
+        if name == "tfidf":
+            _, tfidf_s = timed(index.tfidf_vectors)
+            _, tfidf_peak, tfidf_mb = traced(traced_index.tfidf_vectors)
+            build = {"build_s": round(index_s + tfidf_s, 3), "build_peak_mb": round(max(index_peak, index_mb + tfidf_peak), 1),
+                     "index_mb": round(index_mb + tfidf_mb, 1)}
+
+        def match_one(q):
+            return match_with_index(index, extract, [q['query']], q['property_type'], [q['location']])
+
+        for set_name, queries in query_sets.items():
+            best, latencies = run_queries(match_one, queries)
+            # Separate pass for the allocation peak, so tracing doesn't skew the latencies
+            _, query_peak, _ = traced(lambda: run_queries(match_one, queries[:50]))
+            results.append(dict(backend=name, set=set_name, **score(queries, best, latencies, args.threshold),
+                                **build, query_peak_mb=round(query_peak, 2)))
+    return results
+
+
+def bench_pg_trgm(records, query_sets, args):
+    from psycopg2.extras import RealDictCursor
+    from db import get_connection
+    results = []
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("INSERT INTO tenants (name) VALUES (%s) RETURNING id", (f"bench-{time.time()}",))
+            tenant_id = str(cur.fetchone()['id'])
+            start = time.perf_counter()
+            insert_price_list_items(cur, tenant_id, records)
+            cur.execute("ANALYZE price_lists")
+            load_s = time.perf_counter() - start
+
+            def match_one(q):
+                return match_pg_trgm(cur, tenant_id, [q['query']], q['property_type'], [q['location']])
+
+            for set_name, queries in query_sets.items():
+                best, latencies = run_queries(match_one, queries)
+                results.append(dict(backend="pg_trgm", set=set_name, **score(queries, best, latencies, args.threshold),
+                                    build_s=round(load_s, 3)))
+        conn.rollback()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matcher precision/suspense/latency/memory on a gold set, per backend")
+    parser.add_argument("--rows", type=int, nargs="+", default=[0, 10000, 100000],
+                        help="Catalogue sizes; 0 = the real price list as is")
+    parser.add_argument("--source", default="homeez_price_list_actual.csv")
+    parser.add_argument("--gold", default="tests/matcher_gold.jsonl")
+    parser.add_argument("--synthetic", type=int, default=200, help="Perturbed catalogue queries per size (0 = gold set only)")
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD, help="Auto-match threshold")
+    parser.add_argument("--k", type=int, default=MATCH_CANDIDATE_K or 500, help="Candidate K for the fuzzy_k backend")
+    parser.add_argument("--blend", type=float, default=MATCH_TFIDF_BLEND, help="Cosine weight for the tfidf backend")
+    parser.add_argument("--pg", action="store_true", help="Also run pg_trgm (needs DATABASE_URL; rolled back)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    gold = load_gold(args.gold)
+    base = load_records(args.source)
+    results = []
+    for rows in args.rows:
+        rng = random.Random(args.seed)
+        records = scale_up_records(base, rows, rng) if rows else base
+        query_sets = {"gold": gold}
+        if args.synthetic:
+            query_sets["synthetic"] = synthetic_queries(records, args.synthetic, rng)
+        print(f"\n{len(records)} items: {', '.join(f'{len(q)} {s}' for s, q in query_sets.items())} queries")
+
+        size_results = bench_memory(records, query_sets, args)
+        if args.pg:
+            size_results += bench_pg_trgm(records, query_sets, args)
+        for r in size_results:
+            r["rows"] = len(records)
+        results += size_results
+
+        print(f"{'backend':<12} {'set':<10} {'p@1':>6} {'suspense':>8} {'auto p':>7} {'false':>6} "
+              f"{'p50 ms':>8} {'p99 ms':>8} {'build s':>8} {'index MB':>9}")
+        fmt = lambda v, spec: format(v, spec) if v is not None else format("-", spec[:-3] + "s")
+        for r in size_results:
+            print(f"{r['backend']:<12} {r['set']:<10} {fmt(r['precision_at_1'], '6.3f')} {fmt(r['suspense_rate'], '8.3f')} "
+                  f"{fmt(r['auto_match_precision'], '7.3f')} {fmt(r['false_match_rate'], '6.3f')} "
+                  f"{r['latency_p50_ms']:8.2f} {r['latency_p99_ms']:8.2f} {r['build_s']:8.2f} {fmt(r.get('index_mb'), '9.1f')}")
+
+    if args.json:
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "git_commit": git_commit(),
+                "python": platform.python_version(),
+                "source": args.source,
+                "gold": args.gold,
+                "threshold": args.threshold,
+                "candidate_k": args.k,
+                "tfidf_blend": args.blend,
+                "seed": args.seed,
+            },
+            "results": results,
+        }
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import random
+import time
+import pandas as pd
+from match_index import MatchIndex
+
+# Benchmark: candidate pre-filtering (inverted index, top-K) vs exhaustive fuzzy scoring.
+# Runs fully in memory, no database needed.
+#
+#   python bench_matcher.py --rows 5000 --queries 60 --k 50 100 200 500
+
+
+def load_price_list(file_path="homeez_price_list_actual.csv"):
+    df = pd.read_csv(file_path, header=2)
+    df = df.dropna(subset=["Name", "Price"])
+    descriptions = [str(d).strip() for d in df["Name"]]
+    return list(dict.fromkeys(descriptions))
+
+
+def scale_up(descriptions, rows, rng):
+    """Synthesizes a larger catalogue by recombining real descriptions."""
+    rooms = ["Kitchen", "Toilet", "Bedroom", "Living Room", "Balcony", "Study", "Service Yard", "Foyer"]
+    types = ["HDB", "Condo", "Landed", "EA", "EM", "3-Gen"]
+    items = list(descriptions)
+    seen = set(items)
+    while len(items) < rows:
+        base = rng.choice(descriptions)
+        variant = f"{base} - {rng.choice(rooms)} ({rng.choice(types)} Type {rng.randint(1, 999)})"
+        if variant not in seen:
+            seen.add(variant)
+            items.append(variant)
+    return items[:rows]
+
+
+def perturb(text, rng):
+    """Turns a catalogue description into a plausible spoken/extracted phrasing."""
+    words = text.replace("\n", " ").split()
+    if len(words) > 3:
+        # drop a word and swap two
+        words.pop(rng.randrange(len(words)))
+        i, j = rng.randrange(len(words)), rng.randrange(len(words))
+        words[i], words[j] = words[j], words[i]
+    if words and rng.random() < 0.5:
+        # typo
+        w = rng.randrange(len(words))
+        if len(words[w]) > 3:
+            c = rng.randrange(len(words[w]) - 1)
+            words[w] = words[w][:c] + words[w][c + 1] + words[w][c] + words[w][c + 2:]
+    return " ".join(words)
+
+
+def build_index(descriptions):
+    items = [{"id": i, "description": d, "unit": "lot", "unit_price": 1.0} for i, d in enumerate(descriptions)]
+    return MatchIndex("bench", 0, items, [])
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency of matcher candidate pre-filtering")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=60)
+    parser.add_argument("--k", type=int, nargs="+", default=[50, 100, 200, 500, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    descriptions = scale_up(load_price_list(), args.rows, rng)
+
+    start = time.perf_counter()
+    index = build_index(descriptions)
+    print(f"Index: {len(index)} choices, built in {time.perf_counter() - start:.2f}s")
+
+    queries = [perturb(rng.choice(descriptions), rng) for _ in range(args.queries)]
+
+    exhaustive, exhaustive_time = timed(lambda: index.extract_batch(queries, limit=3, candidate_k=0), args.repeat)
+    print(f"\n{'K':>8} | {'latency (ms)':>12} | {'speedup':>7} | {'recall@1':>8}")
+    print(f"{'all':>8} | {exhaustive_time * 1000:12.1f} | {1.0:7.1f} | {1.0:8.3f}")
+
+    for k in args.k:
+        filtered, filtered_time = timed(lambda: index.extract_batch(queries, limit=3, candidate_k=k), args.repeat)
+        # A hit means pre-filtering kept the exhaustive best score (ties count as hits)
+        hits = sum(1 for e, f in zip(exhaustive, filtered) if e and f and f[0][1] == e[0][1])
+        print(f"{k:>8} | {filtered_time * 1000:12.1f} | {exhaustive_time / filtered_time:7.1f} | {hits / len(queries):8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+from contextlib import contextmanager, asynccontextmanager
+import asyncio
+import os
+import threading
+import time
+import psycopg2
+from psycopg2 import pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg_pool import AsyncConnectionPool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Connections idle for longer than this are pinged (SELECT 1) before being handed out.
+DB_POOL_HEALTHCHECK_SECONDS = float(os.getenv("DB_POOL_HEALTHCHECK_SECONDS", "30"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_last_used = {} # id(conn) -> monotonic time it was returned to the pool
+
+
+def get_pool() -> pool.ThreadedConnectionPool:
+    """Lazily creates the process-wide pool (after any fork, on first use)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, os.getenv("DATABASE_URL"))
+    return _pool
+
+
+def _is_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    idle_since = _last_used.get(id(conn))
+    if idle_since is None or time.monotonic() - idle_since < DB_POOL_HEALTHCHECK_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout():
+    p = get_pool()
+    # Try a couple of times in case the pool hands back connections the server already dropped
+    for _ in range(3):
+        conn = p.getconn()
+        if _is_healthy(conn):
+            return conn
+        _last_used.pop(id(conn), None)
+        p.putconn(conn, close=True)
+    return p.getconn()
+
+
+def _release(conn):
+    p = get_pool()
+    if conn.closed:
+        _last_used.pop(id(conn), None)
+        p.putconn(conn, close=True)
+        return
+    try:
+        if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            # Never hand out a connection with a half-finished transaction
+            conn.rollback()
+    except Exception as e:
+        # Broken connection: discard it, but always return the slot to the pool
+        print(f"Discarding database connection that could not be reset: {e}")
+        _last_used.pop(id(conn), None)
+        p.putconn(conn, close=True)
+        return
+    _last_used[id(conn)] = time.monotonic()
+    p.putconn(conn)
+
+
+@contextmanager
+def get_connection():
+    """
+    Checks a connection out of the shared pool. Blocks while all DB_POOL_MAX
+    connections are in use. Uncommitted work is rolled back on release, so
+    callers still call conn.commit() explicitly.
+    """
+    _slots.acquire()
+    try:
+        conn = _checkout()
+    except Exception:
+        _slots.release()
+        raise
+    try:
+        yield conn
+    finally:
+        try:
+            _release(conn)
+        finally:
+            _slots.release()
+
+
+def close_pool():
+    """Closes every pooled connection (e.g. on application shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+
+# --- Async pool (psycopg 3) for the FastAPI endpoints ---
+_async_pool = None
+_async_pool_lock = None
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    """Lazily opens the async pool on the running event loop."""
+    global _async_pool, _async_pool_lock
+    if _async_pool is None:
+        if _async_pool_lock is None:
+            _async_pool_lock = asyncio.Lock()
+        async with _async_pool_lock:
+            if _async_pool is None:
+                async_pool = AsyncConnectionPool(
+                    os.getenv("DATABASE_URL"),
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_POOL_MAX,
+                    check=AsyncConnectionPool.check_connection,
+                    open=False
+                )
+                await async_pool.open()
+                _async_pool = async_pool
+    return _async_pool
+
+
+@asynccontextmanager
+async def get_async_connection():
+    """
+    Async counterpart of get_connection(). Same %s placeholders and SQL as the
+    sync path; uncommitted work is rolled back on error.
+    """
+    async_pool = await get_async_pool()
+    async with async_pool.connection() as conn:
+        yield conn
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
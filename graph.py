@@ -1,11 +1,31 @@
+import os
+import threading
 from langgraph.graph import StateGraph, END
 from state import RenovationState
 from nodes.matcher import matcher_node
 from nodes.pricer import pricer_node
 from nodes.extractor import extractor_node
-from nodes.guard import guard_node
+from nodes.guard import heuristic_guard_node, llm_guard_node
 from nodes.validator import validator_node
 from nodes.formatter import formatter_node
+from metrics import timed_node
+
+# When on, the LLM guard and the extractor run in the same step once the regex
+# heuristics pass; the extraction is thrown away if the guard says UNSAFE.
+# Safe transcripts then pay max(guard, extractor) latency instead of the sum.
+SPECULATIVE_GUARD = os.getenv("SPECULATIVE_GUARD", "true").lower() == "true"
+
+def heuristic_guard_condition(state):
+    """Stop on a heuristic hit, otherwise run the LLM guard."""
+    if state.get("error"):
+        return END
+    return "llm_guard"
+
+def speculative_guard_condition(state):
+    """Stop on a heuristic hit, otherwise run the LLM guard and the extractor side by side."""
+    if state.get("error"):
+        return END
+    return ["llm_guard", "extractor"]
 
 def guard_condition(state):
     """Check if guard node detected an error."""
@@ -13,27 +33,56 @@ def guard_condition(state):
         return END
     return "extractor"
 
-def build_graph():
+def guard_gate_node(state: RenovationState):
+    """Join point for the speculative branch: drops the extraction if the LLM guard flagged the input."""
+    if state.get("error"):
+        print("Discarding speculative extraction (guard flagged input).")
+        return {"raw_items": []}
+    return {}
+
+def gate_condition(state):
+    if state.get("error"):
+        return END
+    return "matcher"
+
+def build_graph(speculative_guard: bool = None):
+    if speculative_guard is None:
+        speculative_guard = SPECULATIVE_GUARD
+
     workflow = StateGraph(RenovationState)
     
-    # Add nodes
-    workflow.add_node("guard", guard_node)
-    workflow.add_node("extractor", extractor_node)
-    workflow.add_node("matcher", matcher_node)
-    workflow.add_node("pricer", pricer_node)
-    workflow.add_node("validator", validator_node)
-    workflow.add_node("formatter", formatter_node)
+    # Add nodes (each timed into metrics and state["timings"])
+    workflow.add_node("heuristic_guard", timed_node("heuristic_guard", heuristic_guard_node))
+    workflow.add_node("llm_guard", timed_node("llm_guard", llm_guard_node))
+    workflow.add_node("extractor", timed_node("extractor", extractor_node))
+    workflow.add_node("matcher", timed_node("matcher", matcher_node))
+    workflow.add_node("pricer", timed_node("pricer", pricer_node))
+    workflow.add_node("validator", timed_node("validator", validator_node))
+    workflow.add_node("formatter", timed_node("formatter", formatter_node))
     
     # 3. Define Edges
-    workflow.set_entry_point("guard")
-    
-    # Conditional edge from guard
-    workflow.add_conditional_edges(
-        "guard",
-        guard_condition
-    )
+    workflow.set_entry_point("heuristic_guard")
     
-    workflow.add_edge("extractor", "matcher")
+    if speculative_guard:
+        # heuristic_guard -> (llm_guard || extractor) -> gate -> matcher
+        workflow.add_node("gate", timed_node("gate", guard_gate_node))
+        workflow.add_conditional_edges(
+            "heuristic_guard",
+            speculative_guard_condition,
+            ["llm_guard", "extractor", END]
+        )
+        workflow.add_edge(["llm_guard", "extractor"], "gate")
+        workflow.add_conditional_edges("gate", gate_condition, ["matcher", END])
+    else:
+        # heuristic_guard -> llm_guard -> extractor -> matcher
+        workflow.add_conditional_edges(
+            "heuristic_guard",
+            heuristic_guard_condition,
+            ["llm_guard", END]
+        )
+        workflow.add_conditional_edges("llm_guard", guard_condition, ["extractor", END])
+        workflow.add_edge("extractor", "matcher")
+
     workflow.add_edge("matcher", "pricer")
     workflow.add_edge("pricer", "validator")
     workflow.add_edge("validator", "formatter")
@@ -41,6 +90,25 @@ def build_graph():
     
     return workflow.compile()
 
+# Process-level compiled graph; compiling the StateGraph per quotation is wasted work.
+_compiled_graph = None
+_compiled_graph_lock = threading.Lock()
+
+def get_graph():
+    """Returns the shared compiled graph, compiling it on first use."""
+    global _compiled_graph
+    if _compiled_graph is None:
+        with _compiled_graph_lock:
+            if _compiled_graph is None:
+                _compiled_graph = build_graph()
+    return _compiled_graph
+
+def reset_graph():
+    """Forces the next get_graph() to recompile (e.g. after patching nodes in tests)."""
+    global _compiled_graph
+    with _compiled_graph_lock:
+        _compiled_graph = None
+
 if __name__ == "__main__":
     # Test compilation
     app = build_graph()
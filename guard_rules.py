@@ -0,0 +1,241 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import os
+import re
+import threading
+import time
+from db import get_connection
+from metrics import db_span
+
+# Heuristic prompt-injection rules for guard_node. All rules are compiled into a
+# single alternation of named groups, so the transcript is scanned once no matter
+# how many rules there are. Tenants can add rules under tenants.config:
+#
+#   {"guard_patterns": ["reveal your prompt", {"name": "sudo", "pattern": "sudo\\s+mode"}]}
+
+# Seconds a tenant's compiled scanner is reused before tenants.config is re-read.
+GUARD_RULES_TTL_SECONDS = float(os.getenv("GUARD_RULES_TTL_SECONDS", "300"))
+# After a failed read, the fallback (last good or default rules) is used this long before retrying.
+GUARD_RULES_RETRY_SECONDS = float(os.getenv("GUARD_RULES_RETRY_SECONDS", "10"))
+
+DEFAULT_RULES: List[Tuple[str, str]] = [
+    ("ignore_previous_instructions", r"ignore previous instructions"),
+    ("system_override", r"system override"),
+    ("dan_mode", r"DAN mode"),
+    ("developer_mode", r"developer mode"),
+    ("execute_command", r"execute command"),
+    ("forget_your_rules", r"forget your rules"),
+    ("ignore_all_guidelines", r"ignore all guidelines"),
+]
+
+
+class RuleMatch(NamedTuple):
+    rule: str
+    pattern: str
+    start: int
+    end: int
+    text: str
+
+
+_REGEX_METACHARS = set(".^$*+?{}[]\\|()")
+
+
+def _trie_pattern(phrases: List[str]) -> str:
+    """
+    Merges literal phrases into one prefix-trie regex, e.g. ["ab", "ac"] -> "a(?:b|c)".
+    re otherwise tries every branch of a flat alternation at every position.
+    """
+    trie: Dict[str, Any] = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")" + ("?" if "" in node else "")
+
+    return build(trie)
+
+
+# Leading inline flags, e.g. "(?i)"; only allowed at the very start of the combined pattern
+_GLOBAL_FLAGS_RE = re.compile(r"^\(\?([aiLmsux]+)\)")
+# \1 ... \99: group numbers shift once a rule sits inside the combined alternation
+_NUMBERED_BACKREF_RE = re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]")
+
+
+def _regex_branch(group: str, pattern: str) -> Optional[str]:
+    """
+    Wraps a regex rule as a named group of the combined alternation, turning leading
+    global flags into a scoped group ("(?i)a" -> "(?i:a)"). None if it cannot be combined.
+    """
+    if _NUMBERED_BACKREF_RE.search(pattern):
+        return None
+    flags = ""
+    m = _GLOBAL_FLAGS_RE.match(pattern)
+    while m:
+        flags += m.group(1)
+        pattern = pattern[m.end():]
+        m = _GLOBAL_FLAGS_RE.match(pattern)
+    if flags:
+        pattern = f"(?{flags}:{pattern})"
+    return f"(?P<{group}>{pattern})"
+
+
+class PatternScanner:
+    """
+    Compiled, case-insensitive rule set that reports the leftmost rule to fire.
+    Plain phrases (the common case) are merged into one case-insensitive trie;
+    rules using regex syntax share one combined alternation. Either way the
+    transcript is scanned once per group, not per rule, and matches exactly what
+    re.search(pattern, text, re.IGNORECASE) per rule would. Regex rules that cannot
+    join the alternation (numbered backreferences, clashing group names) are skipped
+    with a message instead of failing the whole rule set.
+    """
+
+    def __init__(self, rules: List[Tuple[str, str]]):
+        self.rules: List[Tuple[str, str]] = []
+        self._literals: Dict[str, Tuple[str, str]] = {}
+        self._groups: Dict[str, Tuple[str, str]] = {}
+        branches: List[Tuple[str, str, str, str]] = [] # (group, name, pattern, wrapped branch)
+        for name, pattern in rules:
+            if not pattern:
+                continue
+            if not _REGEX_METACHARS.intersection(pattern):
+                self._literals.setdefault(pattern, (name, pattern))
+                self.rules.append((name, pattern))
+                continue
+            group = f"r{len(branches)}"
+            branch = _regex_branch(group, pattern)
+            if branch is None:
+                print(f"Skipping guard rule '{name}': numbered backreferences are not supported")
+                continue
+            try:
+                # Checked as it will sit in the alternation, not just on its own
+                re.compile(branch)
+            except re.error as e:
+                print(f"Skipping invalid guard rule '{name}': {e}")
+                continue
+            branches.append((group, name, pattern, branch))
+
+        self._regex = None
+        try:
+            if branches:
+                self._regex = re.compile("|".join(b for _, _, _, b in branches), re.IGNORECASE)
+        except re.error:
+            # Branches that only clash when joined (e.g. a repeated group name): keep those that fit
+            branches = self._fitting_branches(branches)
+            self._regex = re.compile("|".join(b for _, _, _, b in branches), re.IGNORECASE) if branches else None
+        for group, name, pattern, _ in branches:
+            self._groups[group] = (name, pattern)
+            self.rules.append((name, pattern))
+
+        # Matched on the original text: lower-casing first would shift offsets ("İ")
+        # and miss case folds that re.IGNORECASE knows ("ſ" for "s")
+        self._literal_regex = re.compile(_trie_pattern(list(self._literals)), re.IGNORECASE) if self._literals else None
+
+    @staticmethod
+    def _fitting_branches(branches):
+        kept = []
+        for candidate in branches:
+            try:
+                re.compile("|".join(b for _, _, _, b in kept + [candidate]))
+                kept.append(candidate)
+            except re.error as e:
+                print(f"Skipping guard rule '{candidate[1]}': conflicts with another rule ({e})")
+        return kept
+
+    def _literal_for(self, matched: str) -> Tuple[str, str]:
+        """The (name, pattern) of the literal rule the trie matched."""
+        hit = self._literals.get(matched)
+        if hit is None:
+            # Differently cased: find the phrase that matches it (only runs on a hit)
+            hit = next(rule for phrase, rule in self._literals.items()
+                       if re.fullmatch(re.escape(phrase), matched, re.IGNORECASE))
+        return hit
+
+    def _scan_literals(self, text: str) -> Optional[RuleMatch]:
+        m = self._literal_regex.search(text)
+        if m is None:
+            return None
+        name, pattern = self._literal_for(m.group())
+        return RuleMatch(name, pattern, m.start(), m.end(), m.group())
+
+    def scan(self, text: str) -> Optional[RuleMatch]:
+        """Returns the leftmost rule match, or None."""
+        hits = []
+        if self._literal_regex is not None:
+            hits.append(self._scan_literals(text))
+        if self._regex is not None:
+            m = self._regex.search(text)
+            if m is not None:
+                name, pattern = self._groups[m.lastgroup]
+                hits.append(RuleMatch(name, pattern, m.start(), m.end(), m.group()))
+        hits = [h for h in hits if h is not None]
+        return min(hits, key=lambda h: h.start) if hits else None
+
+    def __len__(self):
+        return len(self.rules)
+
+
+def parse_tenant_rules(config: Optional[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """Reads config["guard_patterns"]: plain regex strings or {"name", "pattern"} objects."""
+    rules = []
+    for i, entry in enumerate((config or {}).get("guard_patterns") or []):
+        if isinstance(entry, str):
+            rules.append((f"tenant_rule_{i}", entry))
+        elif isinstance(entry, dict) and entry.get("pattern"):
+            rules.append((entry.get("name") or f"tenant_rule_{i}", entry["pattern"]))
+    return rules
+
+
+default_scanner = PatternScanner(DEFAULT_RULES)
+
+_cache: Dict[str, Tuple[float, PatternScanner]] = {} # tenant -> (expires at, scanner)
+_lock = threading.Lock()
+
+
+def get_scanner(tenant_id: Optional[str]) -> PatternScanner:
+    """
+    Default rules plus the tenant's own, cached for GUARD_RULES_TTL_SECONDS.
+    If the tenant config cannot be read, the last good scanner (or the default
+    rules) is used and the read is retried after GUARD_RULES_RETRY_SECONDS.
+    """
+    if not tenant_id:
+        return default_scanner
+    tenant_id = str(tenant_id)
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(tenant_id)
+        if cached and now < cached[0]:
+            return cached[1]
+
+    try:
+        with db_span("guard_rules"), get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT config FROM tenants WHERE id::text = %s", (tenant_id,))
+                res = cur.fetchone()
+        extra = parse_tenant_rules(res[0] if res else None)
+        scanner = PatternScanner(DEFAULT_RULES + extra) if extra else default_scanner
+        expires = now + GUARD_RULES_TTL_SECONDS
+    except Exception as e:
+        print(f"Could not load guard rules for tenant {tenant_id}: {e}")
+        scanner = cached[1] if cached else default_scanner
+        expires = now + GUARD_RULES_RETRY_SECONDS
+
+    with _lock:
+        _cache[tenant_id] = (expires, scanner)
+    return scanner
+
+
+def invalidate(tenant_id: Optional[str] = None):
+    """Drops one tenant's cached scanner, or all of them."""
+    with _lock:
+        if tenant_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(str(tenant_id), None)
@@ -1,23 +1,325 @@
+import numpy as np
 import pandas as pd
-import psycopg2
+import io
 from psycopg2.extras import execute_values
+import argparse
 import os
+import time
 import uuid
-import sys
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
+from db import get_connection
+from match_index import bump_catalog_version
 
 load_dotenv()
 
-# Database connection
-def get_db_connection():
-    try:
-        conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-        return conn
-    except Exception as e:
-        print(f"Error connecting to database: {e}")
-        sys.exit(1)
+# Source column -> record field, per file format
+# New CSV: Service_Category, Name, Unit, Price, Service_ID (+ variant attributes)
+# Old Excel: Category, Description, Unit, Unit Price
+NEW_FORMAT_COLUMNS = {
+    'Service_Category': 'category', 'Name': 'description', 'Unit': 'unit', 'Price': 'price', 'Service_ID': 'item_code',
+    'Property_Type': 'property_type', 'Property_Status': 'property_status', 'Property_Room': 'property_room',
+    'Area': 'area', 'Sub_Category': 'sub_category', 'Description of work': 'work_description'
+}
+OLD_FORMAT_COLUMNS = {'Category': 'category', 'Description': 'description', 'Unit': 'unit', 'Unit Price': 'price'}
 
-def ingest_excel(file_path, tenant_name, create_tenant=False):
+# Parsed record layout (tuples in this order) and price_lists columns they load into
+RECORD_FIELDS = ['category', 'description', 'unit', 'unit_price', 'item_code',
+                 'property_type', 'property_status', 'property_room', 'area', 'sub_category', 'work_description']
+# A description can appear once per combination of these ('All' when not given)
+VARIANT_FIELDS = ['property_type', 'property_status', 'property_room', 'area']
+KNOWN_COLUMNS = set(NEW_FORMAT_COLUMNS) | set(OLD_FORMAT_COLUMNS)
+
+# Title/preamble rows searched for the header row of each sheet
+HEADER_SCAN_ROWS = int(os.getenv("INGEST_HEADER_SCAN_ROWS", "20"))
+# Processes parsing sheets/files in parallel (0 = one per CPU)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0"))
+
+def detect_header_row(raw):
+    """Index of the first row naming at least two known price list columns (0 if none does)."""
+    for i, row in enumerate(raw.head(HEADER_SCAN_ROWS).itertuples(index=False, name=None)):
+        names = {str(v).strip() for v in row if isinstance(v, str)}
+        if len(names & KNOWN_COLUMNS) >= 2:
+            return i
+    return 0
+
+def list_sheets(file_path):
+    """Sheet names of a workbook; [None] for a CSV."""
+    if os.path.splitext(file_path)[1].lower() == '.csv':
+        return [None]
+    return pd.ExcelFile(file_path).sheet_names
+
+def read_price_list(file_path, sheet_name=None):
+    """Reads one CSV or workbook sheet (default: the first), locating its header row."""
+    file_ext = os.path.splitext(file_path)[1].lower()
+    if file_ext == '.csv':
+        # Title rows above the header vary between exports (the Homeez CSV has two)
+        header = detect_header_row(pd.read_csv(file_path, header=None, nrows=HEADER_SCAN_ROWS))
+        df = pd.read_csv(file_path, header=header)
+    else:
+        raw = pd.read_excel(file_path, sheet_name=sheet_name or 0, header=None)
+        header = detect_header_row(raw)
+        df = raw.iloc[header + 1:].reset_index(drop=True)
+        df.columns = raw.iloc[header].tolist()
+        df = df.infer_objects()
+
+    print(f"Loaded {len(df)} rows from {file_path}" + (f" [{sheet_name}]" if sheet_name else ""))
+    # normalize columns
+    df.columns = [c.strip() if isinstance(c, str) else c for c in df.columns]
+    return df
+
+def record_key(record):
+    """(description, *variant attributes): what identifies a price list row within a tenant."""
+    return (record[1],) + tuple(record[RECORD_FIELDS.index(f)] for f in VARIANT_FIELDS)
+
+def _clean_text(column, default):
+    """
+    Collapses whitespace (cells often hold stray newlines); blank or NA -> default.
+    Cleans each distinct value once: attribute columns repeat the same few strings.
+    """
+    codes, uniques = pd.factorize(column)
+    cleaned = [" ".join(str(u).split()) or default for u in uniques] + [default]  # codes of NA are -1
+    return pd.Series(np.array(cleaned, dtype=object)[codes], index=column.index, dtype=object)
+
+def parse_price_list(df, default_category='General'):
+    """
+    Cleans a price list DataFrame into records laid out as RECORD_FIELDS, one per
+    distinct description and variant (property type/status/room, area).
+    Column-wise, no per-row Python.
+    Rows without a category get default_category (the sheet name for workbooks).
+    """
+    # Map columns based on file type/content
+    mapping = NEW_FORMAT_COLUMNS if 'Service_Category' in df.columns else OLD_FORMAT_COLUMNS
+    frame = pd.DataFrame({
+        field: df[col] if col in df.columns else pd.Series(None, index=df.index, dtype=object)
+        for col, field in mapping.items()
+    })
+    for field in RECORD_FIELDS:
+        if field not in frame and field != 'unit_price':
+            frame[field] = None
+
+    # Clean data
+    frame = frame.dropna(subset=['description', 'price'])
+    frame['description'] = frame['description'].astype(str).str.strip()
+    for field in VARIANT_FIELDS:
+        frame[field] = _clean_text(frame[field], 'All')
+    for field in ('sub_category', 'work_description'):
+        frame[field] = _clean_text(frame[field], None)
+
+    # Deduplication
+    frame = frame.drop_duplicates(subset=['description'] + VARIANT_FIELDS, keep='first')
+
+    # Handle price cleaning (remove $, commas); anything non-numeric prices at 0
+    prices = frame['price'].astype(str).str.replace('$', '', regex=False).str.replace(',', '', regex=False).str.strip()
+    frame['unit_price'] = pd.to_numeric(prices, errors='coerce').fillna(0.0).astype(float)
+
+    frame['category'] = frame['category'].astype(object).where(frame['category'].notna(), default_category)
+    frame['unit'] = frame['unit'].astype(object).where(frame['unit'].notna(), 'lot')
+    codes = frame['item_code']
+    frame['item_code'] = codes.astype(str).str.strip().astype(object).where(codes.notna(), None)
+
+    return list(frame[RECORD_FIELDS].itertuples(index=False, name=None))
+
+def diff_price_list(existing, records):
+    """
+    Compares parsed records with the tenant's current rows (dicts with id, is_active
+    and the RECORD_FIELDS columns). Rows are matched on description + variant first,
+    then on item_code, so a renamed item with a stable code keeps its id (and its
+    aliases). Returns (inserts, updates, retire_ids, unchanged) where updates are
+    (id, *record).
+    """
+    by_key = {record_key([row[f] for f in RECORD_FIELDS]): row for row in existing}
+    by_code = {row['item_code']: row for row in existing if row['item_code']}
+    price_pos = RECORD_FIELDS.index('unit_price')
+    matched_ids = set()
+
+    inserts, updates, unchanged = [], [], 0
+    for record in records:
+        item_code = record[RECORD_FIELDS.index('item_code')]
+        row = by_key.get(record_key(record))
+        if row is None or row['id'] in matched_ids:
+            row = by_code.get(item_code) if item_code else None
+            if row is not None and row['id'] in matched_ids:
+                row = None
+        if row is None:
+            inserts.append(record)
+            continue
+
+        matched_ids.add(row['id'])
+        current = [row[f] for f in RECORD_FIELDS]
+        current[price_pos] = round(float(current[price_pos]), 2)
+        incoming = list(record)
+        incoming[price_pos] = round(incoming[price_pos], 2)
+        if row['is_active'] and current == incoming:
+            unchanged += 1
+        else:
+            updates.append((row['id'],) + tuple(record))
+
+    retire_ids = [row['id'] for row in existing if row['is_active'] and row['id'] not in matched_ids]
+    return inserts, updates, retire_ids, unchanged
+
+def _copy_field(value):
+    """CSV field for COPY: None stays unquoted (NULL), text is always quoted (so '' stays '')."""
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return repr(float(value))
+    return '"' + str(value).replace('"', '""') + '"'
+
+def insert_price_list_items(cur, tenant_id, records):
+    """Bulk loads records with COPY (one streamed statement instead of batched INSERTs)."""
+    tenant_id = str(tenant_id)
+    buf = io.StringIO()
+    for record in records:
+        buf.write(",".join(_copy_field(v) for v in (tenant_id,) + tuple(record)))
+        buf.write("\n")
+    buf.seek(0)
+    cur.copy_expert("""
+        COPY price_lists (tenant_id, {})
+        FROM STDIN WITH (FORMAT csv)
+    """.format(", ".join(RECORD_FIELDS)), buf)
+
+def apply_price_list_delta(cur, tenant_id, records):
+    """
+    Upserts records against the tenant's current price list: inserts new items,
+    updates changed (or re-listed) ones in place and retires the ones no longer
+    present. Existing ids, and the aliases pointing at them, are kept.
+    """
+    cur.execute("""
+        SELECT id, is_active, {}
+        FROM price_lists
+        WHERE tenant_id = %s
+    """.format(", ".join(RECORD_FIELDS)), (tenant_id,))
+    columns = [c[0] for c in cur.description]
+    existing = [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    inserts, updates, retire_ids, unchanged = diff_price_list(existing, records)
+
+    if retire_ids:
+        cur.execute("""
+            UPDATE price_lists
+            SET is_active = FALSE, retired_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ANY(%s::uuid[])
+        """, ([str(i) for i in retire_ids],))
+    if updates:
+        execute_values(cur, """
+            UPDATE price_lists AS p
+            SET {},
+                is_active = TRUE, retired_at = NULL, updated_at = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v (id, {})
+            WHERE p.id = v.id
+        """.format(", ".join(f"{f} = v.{f}" for f in RECORD_FIELDS), ", ".join(RECORD_FIELDS)),
+            [(str(u[0]),) + u[1:] for u in updates],
+            template="(%s::uuid, " + ", ".join("%s::numeric" if f == 'unit_price' else "%s" for f in RECORD_FIELDS) + ")",
+            page_size=1000)
+    if inserts:
+        insert_price_list_items(cur, tenant_id, inserts)
+
+    return {"added": len(inserts), "changed": len(updates), "removed": len(retire_ids), "unchanged": unchanged}
+
+def replace_price_list(cur, tenant_id, records):
+    """Old behaviour: delete every item (cascading to aliases) and reinsert the file."""
+    cur.execute("SELECT count(*) FROM price_lists WHERE tenant_id = %s", (tenant_id,))
+    removed = cur.fetchone()[0]
+    print("Clearing existing price list items for this tenant...")
+    cur.execute("DELETE FROM price_lists WHERE tenant_id = %s", (tenant_id,))
+    insert_price_list_items(cur, tenant_id, records)
+    return {"added": len(records), "changed": 0, "removed": removed, "unchanged": 0}
+
+def parse_sheet(file_path, sheet_name=None):
+    """
+    Worker task: reads and parses one CSV or sheet.
+    Returns (file_path, sheet_name, rows_read, records, seconds).
+    """
+    started = time.perf_counter()
+    df = read_price_list(file_path, sheet_name)
+    records = parse_price_list(df, default_category=sheet_name or 'General')
+    return file_path, sheet_name, len(df), records, time.perf_counter() - started
+
+def parse_price_lists(file_paths, workers=None):
+    """
+    Parses every sheet of every file, one worker process per sheet, and merges the
+    results in file/sheet order (the first occurrence of a description/variant wins).
+    Returns (records, per_sheet_stats).
+    """
+    tasks = [(path, sheet) for path in file_paths for sheet in list_sheets(path)]
+    workers = workers or INGEST_WORKERS or os.cpu_count() or 1
+
+    if len(tasks) == 1 or workers == 1:
+        results = [parse_sheet(path, sheet) for path, sheet in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            results = list(pool.map(parse_sheet, *zip(*tasks)))
+
+    records, stats = [], []
+    seen_keys = set()
+    for path, sheet, rows_read, sheet_records, seconds in results:
+        kept = [r for r in sheet_records if record_key(r) not in seen_keys]
+        seen_keys.update(record_key(r) for r in kept)
+        records.extend(kept)
+        stats.append({
+            "file": path, "sheet": sheet, "rows": rows_read, "items": len(kept),
+            "duplicates": len(sheet_records) - len(kept), "seconds": seconds
+        })
+    return records, stats
+
+def ingest_price_lists(file_paths, tenant_name, create_tenant=False, replace=False, workers=None):
+    """
+    Ingests every sheet of every file into one tenant's price list, in a single
+    transaction. Sheets are parsed in parallel processes; see ingest_excel.
+    Returns the added/changed/removed/unchanged counts plus per-sheet stats.
+    """
+    missing = [p for p in file_paths if not os.path.exists(p)]
+    if missing:
+        print(f"File not found: {', '.join(missing)}")
+        return
+
+    # Load Data (before taking a connection: parsing is the slow part)
+    started = time.perf_counter()
+    records, sheet_stats = parse_price_lists(file_paths, workers)
+    parse_seconds = time.perf_counter() - started
+    for st in sheet_stats:
+        label = os.path.basename(st['file']) + (f" [{st['sheet']}]" if st['sheet'] else "")
+        print(f"  {label}: {st['rows']} rows -> {st['items']} items"
+              f" ({st['duplicates']} duplicate(s) of earlier sheets) in {st['seconds']:.2f}s")
+    print(f"Parsed {len(records)} items from {len(sheet_stats)} sheet(s) in {parse_seconds:.2f}s.")
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+
+        try:
+            # Create/Get Tenant
+            cur.execute("SELECT id FROM tenants WHERE name = %s", (tenant_name,))
+            tenant = cur.fetchone()
+            if not tenant:
+                print(f"Creating tenant '{tenant_name}'...")
+                cur.execute("INSERT INTO tenants (name) VALUES (%s) RETURNING id", (tenant_name,))
+                tenant_id = cur.fetchone()[0]
+            else:
+                tenant_id = tenant[0]
+                print(f"Tenant '{tenant_name}' found (ID: {tenant_id}).")
+
+            started = time.perf_counter()
+            if replace:
+                counts = replace_price_list(cur, tenant_id, records)
+            else:
+                counts = apply_price_list_delta(cur, tenant_id, records)
+
+            if counts["added"] or counts["changed"] or counts["removed"]:
+                bump_catalog_version(cur, tenant_id)
+            conn.commit()
+            print(f"Ingestion complete: {counts['added']} added, {counts['changed']} changed, "
+                  f"{counts['removed']} removed, {counts['unchanged']} unchanged "
+                  f"(written in {time.perf_counter() - started:.2f}s).")
+            return dict(counts, sheets=sheet_stats)
+
+        except Exception as e:
+            conn.rollback()
+            print(f"Error during ingestion: {e}")
+        finally:
+            cur.close()
+
+def ingest_excel(file_path, tenant_name, create_tenant=False, replace=False):
     """
     Ingests an Excel price list into the database for a specific tenant.
     
@@ -27,118 +329,23 @@ def ingest_excel(file_path, tenant_name, create_tenant=False):
     - Unit
     - Unit Price
     - Code (Optional)
-    """
-    
-    if not os.path.exists(file_path):
-        print(f"File not found: {file_path}")
-        return
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    try:
-        # Create/Get Tenant
-        cur.execute("SELECT id FROM tenants WHERE name = %s", (tenant_name,))
-        tenant = cur.fetchone()
-        if not tenant:
-            print(f"Creating tenant '{tenant_name}'...")
-            cur.execute("INSERT INTO tenants (name) VALUES (%s) RETURNING id", (tenant_name,))
-            tenant_id = cur.fetchone()[0]
-        else:
-            tenant_id = tenant[0]
-            print(f"Tenant '{tenant_name}' found (ID: {tenant_id}).")
-            # Optional: Clear existing items for a clean reload
-            print("Clearing existing price list items for this tenant...")
-            cur.execute("DELETE FROM price_lists WHERE tenant_id = %s", (tenant_id,))
-
-        # Load Data
-        file_ext = os.path.splitext(file_path)[1].lower()
-        if file_ext == '.csv':
-            # New format has headers on row 3 (index 2)
-            df = pd.read_csv(file_path, header=2)
-        else:
-            # Fallback to excel (assuming row 0 header for old format)
-            df = pd.read_excel(file_path)
-
-        print(f"Loaded {len(df)} rows from {file_path}")
-        
-        # normalize columns
-        df.columns = [c.strip() if isinstance(c, str) else c for c in df.columns]
-
-        # Map columns based on file type/content
-        # New CSV: Service_Category, Name, Unit, Price, Service_ID
-        # Old Excel: Category, Description, Unit, Unit Price
-        
-        records_to_insert = []
-        seen_descriptions = set()
-
-        for _, row in df.iterrows():
-            # Handle new format
-            if 'Service_Category' in df.columns:
-                category = row.get('Service_Category')
-                description = row.get('Name')
-                unit = row.get('Unit')
-                price = row.get('Price')
-                item_code = row.get('Service_ID')
-            else:
-                # Old format fallback
-                category = row.get('Category')
-                description = row.get('Description')
-                unit = row.get('Unit')
-                price = row.get('Unit Price')
-                item_code = None
-
-            # Clean data
-            if pd.isna(description) or pd.isna(price):
-                continue
-                
-            description = str(description).strip()
-            
-            # Deduplication
-            if description in seen_descriptions:
-                continue
-            seen_descriptions.add(description)
-
-            # Handle price cleaning (remove $, commas)
-            try:
-                val = str(price).replace('$', '').replace(',', '').strip()
-                # Handle ranges or text in price? For now assume numeric-ish
-                unit_price = float(val)
-            except ValueError:
-                unit_price = 0.0
-
-            records_to_insert.append((
-                str(tenant_id),
-                category if not pd.isna(category) else 'General',
-                description,
-                unit if not pd.isna(unit) else 'lot',
-                unit_price,
-                item_code
-            ))
-
-        print(f"Inserting {len(records_to_insert)} items...")
-        
-        execute_values(cur, """
-            INSERT INTO price_lists (tenant_id, category, description, unit, unit_price, item_code)
-            VALUES %s
-        """, records_to_insert)
-        conn.commit()
-        print("Ingestion complete.")
-
-    except Exception as e:
-        conn.rollback()
-        print(f"Error during ingestion: {e}")
-    finally:
-        cur.close()
-        conn.close()
+    Every sheet is read, each with its own header row detected. By default the
+    file is diffed against the current price list (see apply_price_list_delta);
+    replace=True deletes and reinserts everything.
+    Returns the added/changed/removed/unchanged counts.
+    """
+    return ingest_price_lists([file_path], tenant_name, create_tenant, replace)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python ingest_excel.py <file_path> <tenant_name> [--create-tenant]")
-        sys.exit(1)
-        
-    file_path = sys.argv[1]
-    tenant_name = sys.argv[2]
-    create_tenant = "--create-tenant" in sys.argv
-    
-    ingest_excel(file_path, tenant_name, create_tenant)
+    parser = argparse.ArgumentParser(description="Load price list files (all sheets) into a tenant's price list")
+    parser.add_argument("paths", nargs="+", metavar="file ... tenant_name",
+                        help="One or more .xlsx/.csv files followed by the tenant name")
+    parser.add_argument("--create-tenant", action="store_true")
+    parser.add_argument("--replace", action="store_true", help="Delete and reinsert instead of applying a delta")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: one per CPU)")
+    args = parser.parse_args()
+    if len(args.paths) < 2:
+        parser.error("need at least one file and a tenant name")
+
+    ingest_price_lists(args.paths[:-1], args.paths[-1], args.create_tenant, args.replace, args.workers)
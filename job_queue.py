@@ -0,0 +1,141 @@
+from typing import Any, Dict, List, Optional, Tuple
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Postgres-backed work queue for quotation processing (quotation_jobs table).
+# Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any number of
+# worker processes can poll the same table without handing out a job twice.
+# Each claim gets a fresh lease_token; completing, failing and renewing a job
+# all require it, so a worker that lost its lease (stalled past JOB_LEASE_SECONDS
+# and re-queued) cannot overwrite the outcome of the run that took over.
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Retry n waits JOB_BACKOFF_SECONDS * 2^(n-1) before it becomes claimable again.
+JOB_BACKOFF_SECONDS = float(os.getenv("JOB_BACKOFF_SECONDS", "10"))
+# A running job whose lease was not renewed within this many seconds is assumed lost and re-queued.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "900"))
+# Workers renew the leases of their in-flight jobs this often.
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", str(JOB_LEASE_SECONDS / 3)))
+
+ENQUEUE_JOB_SQL = """
+    INSERT INTO quotation_jobs (quotation_id, tenant_id, transcript, property_type, profile, max_attempts)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+def enqueue_job(cur, quotation_id: str, tenant_id: str, transcript: str, property_type: Optional[str] = None,
+                profile: bool = False):
+    cur.execute(ENQUEUE_JOB_SQL, (quotation_id, tenant_id, transcript, property_type, profile, JOB_MAX_ATTEMPTS))
+
+
+async def aenqueue_job(cur, quotation_id: str, tenant_id: str, transcript: str, property_type: Optional[str] = None,
+                       profile: bool = False):
+    """enqueue_job for an async (psycopg 3) cursor."""
+    await cur.execute(ENQUEUE_JOB_SQL, (quotation_id, tenant_id, transcript, property_type, profile, JOB_MAX_ATTEMPTS))
+
+
+async def aenqueue_jobs(cur, jobs: List[Tuple[str, str, str, bool]], property_type: Optional[str] = None):
+    """Queues many (quotation_id, tenant_id, transcript, profile) jobs in one pipelined batch."""
+    await cur.executemany(ENQUEUE_JOB_SQL, [
+        (qid, tid, transcript, property_type, profile, JOB_MAX_ATTEMPTS) for qid, tid, transcript, profile in jobs
+    ])
+
+
+def claim_job(cur) -> Optional[Dict[str, Any]]:
+    """
+    Atomically takes the oldest runnable job and marks it running.
+    Expects a RealDictCursor; commit right after so the lock is released.
+    """
+    cur.execute("""
+        UPDATE quotation_jobs
+        SET status = 'running', attempts = attempts + 1, locked_at = CURRENT_TIMESTAMP,
+            lease_token = uuid_generate_v4(), updated_at = CURRENT_TIMESTAMP
+        WHERE id = (
+            SELECT id FROM quotation_jobs
+            WHERE status = 'queued' AND run_after <= CURRENT_TIMESTAMP
+            ORDER BY run_after
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, quotation_id, tenant_id, transcript, property_type, profile, attempts, max_attempts, lease_token
+    """)
+    return cur.fetchone()
+
+
+def complete_job(cur, job: Dict[str, Any]) -> bool:
+    """
+    Marks the job done if this claim still holds its lease; returns False otherwise,
+    in which case the caller should roll back (another worker owns the quotation now).
+    """
+    cur.execute("""
+        UPDATE quotation_jobs
+        SET status = 'done', locked_at = NULL, lease_token = NULL, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s AND status = 'running' AND lease_token = %s
+    """, (job['id'], job['lease_token']))
+    return cur.rowcount == 1
+
+
+def renew_leases(cur, lease_tokens: List[str]) -> int:
+    """Heartbeat: extends the leases of running jobs. Returns how many are still held."""
+    if not lease_tokens:
+        return 0
+    cur.execute("""
+        UPDATE quotation_jobs
+        SET locked_at = CURRENT_TIMESTAMP
+        WHERE status = 'running' AND lease_token = ANY(%s::uuid[])
+    """, (list(lease_tokens),))
+    return cur.rowcount
+
+
+def fail_job(cur, job: Dict[str, Any], error: str) -> bool:
+    """
+    Schedules a retry with exponential backoff, or marks the job and its
+    quotation as failed once attempts are exhausted. Returns True if retried;
+    False too for a claim that lost its lease, which changes nothing (the job is
+    someone else's now).
+    """
+    if job['attempts'] < job['max_attempts']:
+        delay = JOB_BACKOFF_SECONDS * (2 ** (job['attempts'] - 1))
+        cur.execute("""
+            UPDATE quotation_jobs
+            SET status = 'queued', locked_at = NULL, lease_token = NULL, last_error = %s,
+                run_after = CURRENT_TIMESTAMP + make_interval(secs => %s), updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND status = 'running' AND lease_token = %s
+        """, (error, delay, job['id'], job['lease_token']))
+        return cur.rowcount == 1
+
+    cur.execute("""
+        WITH job AS (
+            UPDATE quotation_jobs
+            SET status = 'failed', locked_at = NULL, lease_token = NULL, last_error = %s, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND status = 'running' AND lease_token = %s
+            RETURNING quotation_id
+        )
+        UPDATE quotations SET status = 'failed' WHERE id IN (SELECT quotation_id FROM job)
+    """, (error, job['id'], job['lease_token']))
+    return False
+
+
+def requeue_stale_jobs(cur) -> int:
+    """
+    Recovers jobs left 'running' by a worker that crashed or was restarted:
+    re-queued if attempts remain, otherwise failed. Returns the number recovered.
+    """
+    cur.execute("""
+        WITH stale AS (
+            UPDATE quotation_jobs
+            SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                locked_at = NULL, lease_token = NULL, last_error = 'Worker lease expired', updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND locked_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+            RETURNING quotation_id, status
+        ), failed AS (
+            UPDATE quotations SET status = 'failed'
+            WHERE id IN (SELECT quotation_id FROM stale WHERE status = 'failed')
+            RETURNING id
+        )
+        SELECT count(*) FROM stale
+    """, (JOB_LEASE_SECONDS,))
+    res = cur.fetchone()
+    return res['count'] if isinstance(res, dict) else res[0]
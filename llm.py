@@ -0,0 +1,151 @@
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_google_genai import ChatGoogleGenerativeAI
+from metrics import llm_callback
+
+# Process-level chat model clients, keyed by (model, temperature).
+# Building a ChatGoogleGenerativeAI client validates config and sets up the
+# transport, so nodes share one instance instead of creating one per call.
+#
+# LLM_MODE selects what get_llm() hands out:
+#   live   - the Gemini client (default)
+#   record - the Gemini client, saving every prompt -> response to LLM_FIXTURES_DIR
+#   replay - responses served from LLM_FIXTURES_DIR, no network or API key needed,
+#            after LLM_REPLAY_LATENCY_MS (a number, or "recorded" for the latency seen while recording)
+LLM_MODE = os.getenv("LLM_MODE", "live").lower()
+LLM_FIXTURES_DIR = os.path.abspath(os.getenv(
+    "LLM_FIXTURES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "llm_fixtures")))
+LLM_REPLAY_LATENCY_MS = os.getenv("LLM_REPLAY_LATENCY_MS", "0")
+
+_llms: Dict[Tuple[str, float], BaseChatModel] = {}
+_lock = threading.Lock()
+
+
+class MissingFixtureError(LookupError):
+    """A replayed prompt has no recorded response. Nodes let it through instead of
+    falling back, so a stale fixture set fails the run rather than skewing a benchmark."""
+
+
+def fixture_key(model: str, messages: List[BaseMessage]) -> str:
+    """sha256 of the model and the rendered prompt messages."""
+    payload = "\x1e".join([model] + [f"{m.type}\x1f{m.content}" for m in messages])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class FixtureChatModel(BaseChatModel):
+    """
+    Record/replay stand-in for a chat model. With a `delegate` every call goes to
+    it and the response is saved as <fixtures_dir>/<fixture_key>.json; without one,
+    responses are read back from there (a missing fixture raises MissingFixtureError).
+    """
+    model: str
+    fixtures_dir: str = LLM_FIXTURES_DIR
+    delegate: Optional[BaseChatModel] = None
+    latency_ms: str = LLM_REPLAY_LATENCY_MS
+
+    @property
+    def _llm_type(self) -> str:
+        return "fixture-record" if self.delegate is not None else "fixture-replay"
+
+    def _path(self, messages: List[BaseMessage]) -> str:
+        return os.path.join(self.fixtures_dir, fixture_key(self.model, messages) + ".json")
+
+    def _load(self, messages: List[BaseMessage]) -> Dict[str, Any]:
+        path = self._path(messages)
+        try:
+            with open(path, encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            raise MissingFixtureError(f"No LLM fixture for this {self.model} prompt ({os.path.basename(path)}); "
+                              f"record it with LLM_MODE=record") from None
+
+    def _save(self, messages: List[BaseMessage], message: AIMessage, latency_ms: float):
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        path = self._path(messages)
+        fixture = {
+            "model": self.model,
+            "messages": [{"type": m.type, "content": m.content} for m in messages],
+            "response": message.content,
+            "usage": dict(message.usage_metadata) if message.usage_metadata else None,
+            "latency_ms": round(latency_ms, 1),
+        }
+        # Written aside and renamed, so concurrent recorders never leave a torn file
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(fixture, fh, indent=2, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _delay(self, fixture: Dict[str, Any]) -> float:
+        if self.latency_ms == "recorded":
+            return (fixture.get("latency_ms") or 0) / 1000
+        return float(self.latency_ms) / 1000
+
+    @staticmethod
+    def _result(fixture: Dict[str, Any]) -> ChatResult:
+        message = AIMessage(content=fixture["response"], usage_metadata=fixture.get("usage"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.delegate is not None:
+            start = time.perf_counter()
+            message = self.delegate.invoke(messages, stop=stop, **kwargs)
+            self._save(messages, message, (time.perf_counter() - start) * 1000)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        fixture = self._load(messages)
+        time.sleep(self._delay(fixture))
+        return self._result(fixture)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.delegate is not None:
+            start = time.perf_counter()
+            message = await self.delegate.ainvoke(messages, stop=stop, **kwargs)
+            self._save(messages, message, (time.perf_counter() - start) * 1000)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        fixture = self._load(messages)
+        await asyncio.sleep(self._delay(fixture))
+        return self._result(fixture)
+
+
+def build_llm(model: str, temperature: float = 0) -> BaseChatModel:
+    """A new client for the current LLM_MODE, reporting latency and tokens to metrics.py."""
+    if LLM_MODE == "replay":
+        return FixtureChatModel(model=model, callbacks=[llm_callback])
+    if LLM_MODE == "record":
+        return FixtureChatModel(model=model, delegate=ChatGoogleGenerativeAI(model=model, temperature=temperature),
+                                callbacks=[llm_callback])
+    return ChatGoogleGenerativeAI(model=model, temperature=temperature, callbacks=[llm_callback])
+
+
+def get_llm(model: str, temperature: float = 0) -> BaseChatModel:
+    """Returns the shared client for a model, creating it on first use."""
+    key = (model, temperature)
+    llm = _llms.get(key)
+    if llm is None:
+        with _lock:
+            llm = _llms.get(key)
+            if llm is None:
+                llm = build_llm(model, temperature)
+                _llms[key] = llm
+    return llm
+
+
+def set_llm(model: str, llm: BaseChatModel, temperature: float = 0):
+    """Overrides the client for a model (e.g. a fake chat model in tests/benchmarks)."""
+    with _lock:
+        _llms[(model, temperature)] = llm
+
+
+def reset_llms():
+    """Drops all cached clients so the next get_llm() builds fresh ones."""
+    with _lock:
+        _llms.clear()
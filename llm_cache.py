@@ -0,0 +1,126 @@
+from typing import Any, Dict, Optional
+import hashlib
+import os
+import re
+import threading
+from psycopg2.extras import Json
+from dotenv import load_dotenv
+from db import get_connection
+from metrics import db_span
+
+load_dotenv()
+
+# Content-addressed cache for LLM node results (guard verdicts, extracted items).
+# Keyed by sha256(kind, model, prompt version, normalized input), stored in the
+# llm_cache table so every API/worker process shares it.
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000"))
+# Expired/overflow entries are purged once every this many writes.
+LLM_CACHE_EVICT_EVERY = int(os.getenv("LLM_CACHE_EVICT_EVERY", "100"))
+
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+_writes = 0
+
+
+def prompt_version(prompt) -> str:
+    """Short hash of a ChatPromptTemplate, so editing a prompt invalidates its cache entries."""
+    return hashlib.sha256(prompt.pretty_repr().encode("utf-8")).hexdigest()[:12]
+
+
+def normalize_input(text: str) -> str:
+    """Collapses whitespace so re-submitted or re-wrapped transcripts share a key."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(kind: str, model: str, version: str, text: str) -> str:
+    payload = "\x1f".join([kind, model, version, normalize_input(text)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _count(kind: str, field: str):
+    with _stats_lock:
+        counters = _stats.setdefault(kind, {"hits": 0, "misses": 0, "errors": 0})
+        counters[field] += 1
+
+
+def get(kind: str, model: str, version: str, text: str) -> Optional[Any]:
+    """Returns the cached value, or None on a miss (or if the cache is unavailable)."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    try:
+        with db_span("llm_cache_get"), get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE llm_cache
+                    SET last_hit_at = CURRENT_TIMESTAMP, hit_count = hit_count + 1
+                    WHERE cache_key = %s
+                      AND created_at > CURRENT_TIMESTAMP - make_interval(secs => %s)
+                    RETURNING value
+                """, (cache_key(kind, model, version, text), LLM_CACHE_TTL_SECONDS))
+                res = cur.fetchone()
+            conn.commit()
+    except Exception as e:
+        print(f"LLM cache lookup failed: {e}")
+        _count(kind, "errors")
+        return None
+
+    _count(kind, "hits" if res else "misses")
+    return res[0] if res else None
+
+
+def put(kind: str, model: str, version: str, text: str, value: Any):
+    """Stores a value; failures are logged and ignored."""
+    global _writes
+    if not LLM_CACHE_ENABLED:
+        return
+    try:
+        with db_span("llm_cache_put"), get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO llm_cache (cache_key, kind, model, prompt_version, value)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (cache_key) DO UPDATE
+                    SET value = EXCLUDED.value, created_at = CURRENT_TIMESTAMP, last_hit_at = CURRENT_TIMESTAMP
+                """, (cache_key(kind, model, version, text), kind, model, version, Json(value)))
+
+                with _stats_lock:
+                    _writes += 1
+                    evict_now = _writes % LLM_CACHE_EVICT_EVERY == 0
+                if evict_now:
+                    evict(cur)
+            conn.commit()
+    except Exception as e:
+        print(f"LLM cache write failed: {e}")
+        _count(kind, "errors")
+
+
+def evict(cur):
+    """Drops expired entries, then the least recently hit ones beyond LLM_CACHE_MAX_ENTRIES."""
+    cur.execute("""
+        DELETE FROM llm_cache
+        WHERE created_at <= CURRENT_TIMESTAMP - make_interval(secs => %s)
+    """, (LLM_CACHE_TTL_SECONDS,))
+    cur.execute("""
+        DELETE FROM llm_cache
+        WHERE cache_key IN (
+            SELECT cache_key FROM llm_cache
+            ORDER BY last_hit_at DESC
+            OFFSET %s
+        )
+    """, (LLM_CACHE_MAX_ENTRIES,))
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """Hit/miss/error counts for this process, per kind."""
+    with _stats_lock:
+        return {kind: dict(counters) for kind, counters in _stats.items()}
+
+
+STORED_STATS_SQL = """
+    SELECT kind, count(*) AS entries, COALESCE(sum(hit_count), 0) AS hits
+    FROM llm_cache
+    GROUP BY kind
+"""
@@ -1,25 +1,31 @@
 import sys
-from graph import build_graph
-import psycopg2
-import os
+from graph import get_graph
+from db import get_connection
 import uuid
 from dotenv import load_dotenv
+from profiling import profiled
 
 load_dotenv()
 
 def manual_test():
     if len(sys.argv) < 2:
-        print("Usage: python manual_test.py <item1> <item2> ... [--tenant=<tenant_name>]")
+        print("Usage: python manual_test.py <item1> <item2> ... [--tenant=<tenant_name>] [--property-type=<HDB|Condo|Landed>] [--profile]")
         print("Example: python manual_test.py 'Vinyl Flooring' 'Wall Painting' --tenant=Homeez")
         return
 
     # Parse args
     tenant_name = "Homeez"
+    property_type = None
+    profile = False
     raw_items = []
     
     for arg in sys.argv[1:]:
         if arg.startswith("--tenant="):
             tenant_name = arg.split("=")[1]
+        elif arg.startswith("--property-type="):
+            property_type = arg.split("=")[1]
+        elif arg == "--profile":
+            profile = True
         else:
             raw_items.append(arg)
             
@@ -31,37 +37,37 @@ def manual_test():
 
     # Connect to DB to get Tenant ID
     try:
-        conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-        cur = conn.cursor()
-        
-        cur.execute("SELECT id FROM tenants WHERE name = %s", (tenant_name,))
-        res = cur.fetchone()
+        with get_connection() as conn:
+            cur = conn.cursor()
+            
+            cur.execute("SELECT id FROM tenants WHERE name = %s", (tenant_name,))
+            res = cur.fetchone()
+            cur.close()
         
         if not res:
             print(f"Error: Tenant '{tenant_name}' not found. Please verify the name or check the database.")
-            conn.close()
             return
             
         tenant_id = res[0]
-        cur.close()
-        conn.close()
     except Exception as e:
         print(f"Database error: {e}")
         return
         
     # Build Graph
-    app = build_graph()
+    app = get_graph()
     
     inputs = {
         "raw_items": raw_items,
         "tenant_id": str(tenant_id),
-        "session_id": str(uuid.uuid4())
+        "session_id": str(uuid.uuid4()),
+        "property_type": property_type
     }
     
     print(f"Testing items: {raw_items}\n")
     
-    # Run
-    result = app.invoke(inputs)
+    # Run (with --profile, the flamegraph is saved under PROFILE_DIR keyed by the session id)
+    with profiled(inputs["session_id"], profile):
+        result = app.invoke(inputs)
     
     print("\n--- RESULTS ---")
     matched = result.get('matched_items', [])
@@ -0,0 +1,407 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import threading
+import numpy as np
+from rapidfuzz import fuzz as rfuzz
+from rapidfuzz import process as rprocess
+from thefuzz import utils
+
+# Number of tenant indexes kept in memory before the least recently used one is dropped.
+MATCH_INDEX_CACHE_SIZE = int(os.getenv("MATCH_INDEX_CACHE_SIZE", "32"))
+# Threads used by the batch scorer (-1 = all cores).
+MATCH_WORKERS = int(os.getenv("MATCH_WORKERS", "-1"))
+# Candidates kept per query by the inverted index before exact fuzzy scoring (0 = score everything).
+MATCH_CANDIDATE_K = int(os.getenv("MATCH_CANDIDATE_K", "500"))
+# TF-IDF backend: weight of the cosine similarity vs token_sort_ratio in the blended score
+# (1 = cosine only), and how many cosine top-k candidates get the fuzzy re-score.
+MATCH_TFIDF_BLEND = float(os.getenv("MATCH_TFIDF_BLEND", "0.5"))
+MATCH_TFIDF_CANDIDATES = int(os.getenv("MATCH_TFIDF_CANDIDATES", "50"))
+
+
+def tokenize(normalized: str) -> List[str]:
+    """Whole tokens plus space-padded character trigrams of each token."""
+    features = []
+    for token in normalized.split():
+        features.append(token)
+        padded = f" {token} "
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+
+def normalize(text: str) -> str:
+    """
+    Normalizes a description the same way thefuzz does before scoring
+    (ASCII only, lower case, punctuation stripped).
+    """
+    return utils.full_process(text, force_ascii=True)
+
+
+# Location words that say nothing about which area an item is priced for
+GENERIC_AREA_WORDS = {"all", "and", "area", "room", "the", "whole", "house", "unit", "general"}
+# Extracted location wording -> the word the price list uses for that area
+AREA_SYNONYMS = {"bathroom": "toilet", "washroom": "toilet", "wc": "toilet", "hall": "living", "lounge": "living"}
+
+
+def area_words(text: Optional[str]) -> set:
+    """Distinctive, singularized words of a location or price list Area value."""
+    words = set()
+    for word in normalize(text or "").split():
+        if len(word) > 3 and word.endswith("s"):
+            word = word[:-1]
+        word = AREA_SYNONYMS.get(word, word)
+        if word not in GENERIC_AREA_WORDS:
+            words.add(word)
+    return words
+
+
+def rank_shortlist(query: str, choices: List[str], limit: int = 3) -> List[Tuple[str, int, int]]:
+    """
+    Re-ranks a candidate shortlist with token_sort_ratio, same semantics as
+    MatchIndex.extract_batch. Returns (choice_text, score, position_in_choices).
+    """
+    if not choices:
+        return []
+    row = rprocess.cdist(
+        [normalize(query)],
+        [normalize(c) for c in choices],
+        scorer=rfuzz.token_sort_ratio,
+        processor=None,
+        dtype=np.float64
+    )[0]
+    top = np.argsort(-row, kind="stable")[:limit]
+    return [(choices[i], int(round(row[i])), int(i)) for i in top]
+
+
+class VariantFilter:
+    """Per-item property type and area, precomputed so a filter mask costs a few numpy ops."""
+
+    def __init__(self, items: List[Dict[str, Any]]):
+        self.size = len(items)
+        self.property_types = np.array([(item.get('property_type') or 'All').casefold() for item in items])
+        areas = [item.get('area') or 'All' for item in items]
+        self.areas = sorted(set(areas))
+        area_ids = {a: i for i, a in enumerate(self.areas)}
+        self.area_ids = np.array([area_ids[a] for a in areas], dtype=np.int32)
+        self.area_words = [area_words(a) for a in self.areas]
+
+    def mask(self, property_type: Optional[str] = None, location: Optional[str] = None) -> Optional[np.ndarray]:
+        """
+        Boolean mask of the items that fit the property type and the location's
+        area (items priced for 'All' always fit). Returns None when nothing is
+        filtered out, and also when a filter would leave no candidates (e.g. a
+        location or property type the price list does not distinguish), so
+        matching falls back to the whole list.
+        """
+        if not self.size:
+            return None
+        mask = np.ones(self.size, dtype=bool)
+
+        if property_type:
+            wanted = property_type.casefold()
+            if (self.property_types == wanted).any():
+                mask &= (self.property_types == wanted) | (self.property_types == 'all')
+
+        words = area_words(location)
+        if words:
+            area_ok = np.array([a.casefold() == 'all' or bool(w & words) for a, w in zip(self.areas, self.area_words)])
+            if any(ok and a.casefold() != 'all' for ok, a in zip(area_ok, self.areas)):
+                mask &= area_ok[self.area_ids]
+
+        if mask.all() or not mask.any():
+            return None
+        return mask
+
+
+class MatchIndex:
+    """
+    In-memory view of a tenant's price list and aliases, built once and reused
+    by matcher_node until the tenant's catalog_version changes.
+    """
+
+    def __init__(self, tenant_id: str, version: int, price_list_items: List[Dict[str, Any]], aliases: List[Dict[str, Any]]):
+        self.tenant_id = tenant_id
+        self.version = version
+
+        # Map IDs to items for easy lookup
+        self.items_by_id: Dict[Any, Dict[str, Any]] = {item['id']: item for item in price_list_items}
+
+        # Choices for fuzzy search: description + alias_text, with the item behind each
+        # choice (same-text variants such as HDB vs Condo stay separate choices)
+        self.choices_list: List[str] = []
+        self.choice_items: List[Dict[str, Any]] = []
+        # Price list choices per description, to find every variant of a match
+        self.description_choices: Dict[str, List[int]] = {}
+
+        for item in price_list_items:
+            self.description_choices.setdefault(item['description'], []).append(len(self.choices_list))
+            self.choices_list.append(item['description'])
+            self.choice_items.append(item)
+
+        # Incorporate aliases
+        # Verified aliases also resolve exactly on their normalized text, skipping fuzzy scoring
+        self.verified_aliases: Dict[str, Dict[str, Any]] = {}
+        for alias in aliases:
+            text = alias['alias_text']
+            linked_item = self.items_by_id.get(alias['price_list_id'])
+            if linked_item:
+                self.choices_list.append(text)
+                self.choice_items.append(linked_item)
+                if alias.get('is_verified'):
+                    self.verified_aliases[normalize(text)] = linked_item
+
+        self.normalized_choices = [normalize(c) for c in self.choices_list]
+        self._build_inverted_index()
+        self.variants = VariantFilter(self.choice_items)
+        # Built lazily by tfidf_vectors(), only for tenants on the tfidf backend
+        self._tfidf = None
+        self._tfidf_lock = threading.Lock()
+
+    def _build_inverted_index(self):
+        """Token/trigram -> choice postings, weighted by inverse document frequency."""
+        postings: Dict[str, List[int]] = {}
+        for i, text in enumerate(self.normalized_choices):
+            for feature in set(tokenize(text)):
+                postings.setdefault(feature, []).append(i)
+
+        n = len(self.normalized_choices)
+        self.postings = {f: np.array(ids, dtype=np.int32) for f, ids in postings.items()}
+        self.idf = {f: float(np.log(1 + n / len(ids))) for f, ids in postings.items()}
+
+    def filter_mask(self, property_type: Optional[str] = None, location: Optional[str] = None) -> Optional[np.ndarray]:
+        """Choices fitting the property type and location; see VariantFilter.mask."""
+        return self.variants.mask(property_type, location)
+
+    def candidates(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Returns up to k choice indices (ascending) sharing the most IDF-weighted
+        tokens/trigrams with the query, restricted to mask if given.
+        """
+        weights = np.zeros(len(self.choices_list), dtype=np.float32)
+        for feature in set(tokenize(normalize(query))):
+            ids = self.postings.get(feature)
+            if ids is not None:
+                weights[ids] += self.idf[feature]
+        if mask is not None:
+            weights[~mask] = -np.inf
+
+        top = np.argpartition(-weights, k - 1)[:k]
+        return np.sort(top)
+
+    def description_variants(self, description: str, mask: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Items priced under this exact description (one per variant), restricted to mask if given."""
+        return [self.choice_items[c] for c in self.description_choices.get(description, [])
+                if mask is None or mask[c]]
+
+    def exact_alias(self, text: str) -> Optional[Dict[str, Any]]:
+        """Returns the price list item for a verified alias matching text verbatim (after normalization)."""
+        return self.verified_aliases.get(normalize(text))
+
+    def extract_batch(self, queries: List[str], limit: int = 3, candidate_k: Optional[int] = None,
+                      mask: Optional[np.ndarray] = None) -> List[List[Tuple[str, int, int]]]:
+        """
+        Scores every query against the choices in one C-level pass and returns
+        the top matches per query as (choice_text, score, choice_index).
+
+        Same results as thefuzz process.extract(..., scorer=fuzz.token_sort_ratio):
+        ranking uses the raw scores (ties keep choice order), then scores are rounded.
+
+        When the index holds more than candidate_k choices (default
+        MATCH_CANDIDATE_K), each query is only scored against its top-k
+        candidates from the inverted index. mask (see filter_mask) restricts
+        the choices considered.
+        """
+        if not queries or not self.choices_list:
+            return [[] for _ in queries]
+
+        k = MATCH_CANDIDATE_K if candidate_k is None else candidate_k
+        normalized_queries = [normalize(q) for q in queries]
+        allowed = np.flatnonzero(mask) if mask is not None else None
+        size = len(allowed) if allowed is not None else len(self.choices_list)
+
+        if not k or k >= size:
+            scores = rprocess.cdist(
+                normalized_queries,
+                self.normalized_choices if allowed is None else [self.normalized_choices[i] for i in allowed],
+                scorer=rfuzz.token_sort_ratio,
+                processor=None,
+                dtype=np.float64,
+                workers=MATCH_WORKERS
+            )
+            return [self._top_matches(row, allowed, limit) for row in scores]
+
+        results = []
+        for query, normalized_query in zip(queries, normalized_queries):
+            ids = self.candidates(query, k, mask)
+            row = rprocess.cdist(
+                [normalized_query],
+                [self.normalized_choices[i] for i in ids],
+                scorer=rfuzz.token_sort_ratio,
+                processor=None,
+                dtype=np.float64
+            )[0]
+            results.append(self._top_matches(row, ids, limit))
+        return results
+
+    def _top_matches(self, row: np.ndarray, ids: Optional[np.ndarray], limit: int) -> List[Tuple[str, int, int]]:
+        top = np.argsort(-row, kind="stable")[:limit]
+        matches = []
+        for pos in top:
+            i = int(ids[pos]) if ids is not None else int(pos)
+            matches.append((self.choices_list[i], int(round(row[pos])), i))
+        return matches
+
+    def tfidf_vectors(self):
+        """
+        Character n-gram TF-IDF matrix of the choices (rows L2-normalized), built on
+        first use and kept for the life of the index.
+        """
+        if self._tfidf is None:
+            with self._tfidf_lock:
+                if self._tfidf is None:
+                    # Imported here so processes on the fuzzy backend don't pay for scikit-learn
+                    from sklearn.feature_extraction.text import TfidfVectorizer
+                    # Word-bounded trigrams: as accurate as 2-4 grams on misspelled items,
+                    # with a fraction of the vocabulary (fit time and product cost)
+                    vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 3), sublinear_tf=True, dtype=np.float32)
+                    matrix = vectorizer.fit_transform(self.normalized_choices).tocsr()
+                    self._tfidf = (vectorizer, matrix)
+        return self._tfidf
+
+    def extract_tfidf(self, queries: List[str], limit: int = 3, mask: Optional[np.ndarray] = None,
+                      blend: Optional[float] = None) -> List[List[Tuple[str, int, int]]]:
+        """
+        Scores all queries with one matrix product against the TF-IDF matrix, keeps
+        the MATCH_TFIDF_CANDIDATES best by cosine, and ranks those by
+        blend * cosine + (1 - blend) * token_sort_ratio (both on a 0-100 scale).
+        Returns (choice_text, score, choice_index) like extract_batch.
+        """
+        if not queries or not self.choices_list:
+            return [[] for _ in queries]
+        blend = MATCH_TFIDF_BLEND if blend is None else blend
+
+        vectorizer, matrix = self.tfidf_vectors()
+        normalized_queries = [normalize(q) for q in queries]
+        # Nearly every choice shares some trigram with a query, so the result is dense;
+        # sparse @ dense is several times faster than sparse @ sparse here
+        query_vectors = vectorizer.transform(normalized_queries).T.toarray()
+        cosine = np.asarray(matrix @ query_vectors).T
+        if mask is not None:
+            cosine[:, ~mask] = -1.0
+
+        k = min(max(limit, MATCH_TFIDF_CANDIDATES), int(mask.sum()) if mask is not None else len(self.choices_list))
+        results = []
+        for normalized_query, row in zip(normalized_queries, cosine):
+            ids = np.sort(np.argpartition(-row, k - 1)[:k])
+            fuzzy = rprocess.cdist(
+                [normalized_query],
+                [self.normalized_choices[i] for i in ids],
+                scorer=rfuzz.token_sort_ratio,
+                processor=None,
+                dtype=np.float64
+            )[0]
+            blended = blend * 100.0 * np.clip(row[ids], 0.0, 1.0) + (1.0 - blend) * fuzzy
+            results.append(self._top_matches(blended, ids, limit))
+        return results
+
+    def __len__(self):
+        return len(self.choices_list)
+
+
+# Generic ('All') variants first, then price list order; {t} is an optional table alias prefix.
+# The matcher still prefers the quotation's own property type over 'All' (preferred_variants)
+VARIANT_ORDER = "({t}property_type <> 'All'), ({t}area <> 'All'), {t}list_order"
+
+
+def load_match_index(cur, tenant_id: str, version: int) -> MatchIndex:
+    """Builds a MatchIndex from the database. Expects a RealDictCursor."""
+    # 1. Fetch Price List items for this Tenant, in VARIANT_ORDER so score ties
+    # (same description priced per variant) always resolve to the same row
+    cur.execute("""
+        SELECT id, description, unit, unit_price, property_type, area
+        FROM price_lists
+        WHERE tenant_id = %s AND is_active
+        ORDER BY {}
+    """.format(VARIANT_ORDER.format(t="")), (tenant_id,))
+    price_list_items = cur.fetchall()
+
+    # 2. Fetch Aliases for this Tenant
+    cur.execute("""
+        SELECT alias_text, price_list_id, is_verified
+        FROM product_aliases
+        WHERE tenant_id = %s
+    """, (tenant_id,))
+    aliases = cur.fetchall()
+
+    return MatchIndex(tenant_id, version, price_list_items, aliases)
+
+
+def get_catalog_version(cur, tenant_id: str) -> int:
+    cur.execute("SELECT catalog_version FROM tenants WHERE id = %s", (tenant_id,))
+    res = cur.fetchone()
+    if not res:
+        return 0
+    return res['catalog_version'] if isinstance(res, dict) else res[0]
+
+
+BUMP_CATALOG_VERSION_SQL = """
+    UPDATE tenants
+    SET catalog_version = catalog_version + 1
+    WHERE id = %s
+"""
+
+
+def bump_catalog_version(cur, tenant_id: str):
+    """
+    Marks the tenant's price list/aliases as changed so every process holding a
+    cached MatchIndex rebuilds it on the next run. Call inside the same
+    transaction that modifies price_lists or product_aliases.
+    """
+    cur.execute(BUMP_CATALOG_VERSION_SQL, (tenant_id,))
+    invalidate(str(tenant_id))
+
+
+async def abump_catalog_version(cur, tenant_id: str):
+    """bump_catalog_version for an async (psycopg 3) cursor."""
+    await cur.execute(BUMP_CATALOG_VERSION_SQL, (tenant_id,))
+    invalidate(str(tenant_id))
+
+
+# --- Process-level LRU cache ---
+_cache: "OrderedDict[str, MatchIndex]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_match_index(cur, tenant_id: str) -> MatchIndex:
+    """
+    Returns the cached MatchIndex for a tenant, rebuilding it when the stored
+    catalog_version no longer matches. Costs one primary-key lookup on a hit.
+    """
+    tenant_id = str(tenant_id)
+    version = get_catalog_version(cur, tenant_id)
+
+    with _lock:
+        index = _cache.get(tenant_id)
+        if index is not None and index.version == version:
+            _cache.move_to_end(tenant_id)
+            return index
+
+    print(f"Building match index for tenant {tenant_id} (version {version})...")
+    index = load_match_index(cur, tenant_id, version)
+
+    with _lock:
+        _cache[tenant_id] = index
+        _cache.move_to_end(tenant_id)
+        while len(_cache) > MATCH_INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return index
+
+
+def invalidate(tenant_id: Optional[str] = None):
+    """Drops one tenant's cached index, or all of them."""
+    with _lock:
+        if tenant_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(str(tenant_id), None)
@@ -0,0 +1,151 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+import functools
+import os
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest, start_http_server
+
+# Prometheus metrics for the quotation graph, plus a per-quotation timing breakdown.
+# Every graph node runs inside node_span() (see timed_node in graph.py); spans opened
+# while it runs (LLM calls, DB queries, fuzzy scoring) are observed as metrics and
+# also summed into that node's entry of state["timings"], which is stored on the
+# quotation row, e.g.
+#
+#   {"total_ms": 2140.3,
+#    "extractor": {"total_ms": 1980.1, "llm_ms": 1975.4, "llm_calls": 1, "input_tokens": 1210, "output_tokens": 350},
+#    "matcher": {"total_ms": 41.2, "db_ms": 6.3, "scoring_ms": 30.8, "matched": 4, "suspense": 1}}
+#
+# The API serves /metrics; workers expose theirs on METRICS_PORT (0 = off).
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+NODE_SECONDS = Histogram("quotation_node_seconds", "Wall time per graph node", ["node"])
+GRAPH_SECONDS = Histogram("quotation_graph_seconds", "Wall time of a whole graph run",
+                          buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, float("inf")))
+LLM_SECONDS = Histogram("quotation_llm_seconds", "Chat model call latency", ["model"],
+                        buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, float("inf")))
+LLM_TOKENS = Counter("quotation_llm_tokens_total", "Chat model tokens", ["model", "direction"])
+DB_SECONDS = Histogram("quotation_db_seconds", "Database time per query kind", ["query"])
+SCORING_SECONDS = Histogram("quotation_match_scoring_seconds", "Candidate scoring time per matcher backend", ["backend"])
+MATCH_ITEMS = Counter("quotation_items_total", "Extracted items by matcher outcome", ["outcome"])
+
+_current: ContextVar[Optional[Dict[str, Any]]] = ContextVar("quotation_node_timings", default=None)
+_lock = threading.Lock()
+
+
+def _add(key: str, value: float):
+    """Adds to the running node's breakdown, if any (nodes may score in several threads)."""
+    timings = _current.get()
+    if timings is not None:
+        with _lock:
+            timings[key] = round(timings.get(key, 0) + value, 1)
+
+
+@contextmanager
+def node_span(node: str):
+    """Times one node run; yields the breakdown dict that inner spans add to."""
+    timings: Dict[str, Any] = {}
+    token = _current.set(timings)
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        elapsed = time.perf_counter() - start
+        _current.reset(token)
+        NODE_SECONDS.labels(node).observe(elapsed)
+        timings["total_ms"] = round(elapsed * 1000, 1)
+
+
+def timed_node(node: str, fn):
+    """Wraps a graph node so its timing breakdown is returned as {"timings": {node: ...}}."""
+    @functools.wraps(fn)
+    def wrapper(state):
+        with node_span(node) as timings:
+            update = fn(state)
+        return {**(update or {}), "timings": {node: timings}}
+    return wrapper
+
+
+@contextmanager
+def db_span(query: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        DB_SECONDS.labels(query).observe(elapsed)
+        _add("db_ms", elapsed * 1000)
+
+
+@contextmanager
+def scoring_span(backend: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        SCORING_SECONDS.labels(backend).observe(elapsed)
+        _add("scoring_ms", elapsed * 1000)
+
+
+def count_item(outcome: str):
+    """outcome: "alias", "matched" or "suspense"."""
+    MATCH_ITEMS.labels(outcome).inc()
+    _add("suspense" if outcome == "suspense" else "matched", 1)
+
+
+def observe_graph(seconds: float):
+    GRAPH_SECONDS.observe(seconds)
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Chat model latency and token usage, attached to every client built by llm.get_llm()."""
+    # Inline, so async runs still record into the calling node's breakdown
+    run_inline = True
+
+    def __init__(self):
+        self._started: Dict[Any, Any] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._started[run_id] = ((metadata or {}).get("ls_model_name") or "unknown", time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        model, start = started
+        elapsed = time.perf_counter() - start
+        LLM_SECONDS.labels(model).observe(elapsed)
+        _add("llm_ms", elapsed * 1000)
+        _add("llm_calls", 1)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                for direction in ("input", "output"):
+                    tokens = usage.get(f"{direction}_tokens") or 0
+                    if tokens:
+                        LLM_TOKENS.labels(model, direction).inc(tokens)
+                        _add(f"{direction}_tokens", tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            LLM_SECONDS.labels(started[0]).observe(time.perf_counter() - started[1])
+
+
+llm_callback = LLMMetricsCallback()
+
+
+def latest():
+    """(body, content type) for a /metrics response."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """Serves this process's metrics on a side port (for workers); no-op if port is 0."""
+    if port:
+        start_http_server(port)
+        print(f"Metrics on :{port}/metrics")
@@ -1,10 +1,55 @@
 from typing import Dict, Any, List
-from state import RenovationState
-from langchain_google_genai import ChatGoogleGenerativeAI
+from state import RenovationState, ExtractedItem
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 import json
+import os
 import re
+from llm import get_llm, MissingFixtureError
+import llm_cache
+from match_index import normalize
+
+EXTRACTOR_MODEL = "gemini-3-pro-preview"
+
+# Long transcripts are split into overlapping windows extracted in parallel
+EXTRACTOR_CHUNK_CHARS = int(os.getenv("EXTRACTOR_CHUNK_CHARS", "6000"))
+EXTRACTOR_CHUNK_OVERLAP = int(os.getenv("EXTRACTOR_CHUNK_OVERLAP", "2")) # utterances repeated between windows
+EXTRACTOR_MAX_CONCURRENCY = int(os.getenv("EXTRACTOR_MAX_CONCURRENCY", "4"))
+
+TIMESTAMP_RE = re.compile(r"\[\d{1,2}:\d{2}(:\d{2})?\]")
+# "ID (Alex):" / "Client (Mrs. Tan):" on a line of its own
+SPEAKER_HEADER_RE = re.compile(r"^[\w .'-]{1,40}(\([^)]{0,40}\))?:$")
+# "Alex: we'll hack the wall" -> "we'll hack the wall"
+SPEAKER_PREFIX_RE = re.compile(r"^[\w .'-]{1,40}\([^)]{0,40}\):\s*")
+# "Kitchen Discussion (8:00 - 10:00)"
+SECTION_HEADING_RE = re.compile(r"^.{1,80}\(\d{1,2}:\d{2}\s*-\s*\d{1,2}:\d{2}\)$")
+# Utterances made up only of greetings, thanks and goodbyes are dropped as small
+# talk; anything else (even "I think glass would be easier to clean") may be scope
+COURTESY = (
+    r"(hi|hello|hey|good (morning|afternoon|evening)|nice to meet you|"
+    r"thanks|thank you( (so|very) much)?|thanks for coming( down)?|"
+    r"bye|goodbye|see you( (soon|tomorrow|then))?|take care|(we )?look forward to it|cheers)"
+)
+SMALL_TALK_RE = re.compile(rf"^({COURTESY}[\s,.!]*)+$", re.IGNORECASE)
+
+EXTRACTOR_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are an expert renovation quantity surveyor.
+Your task is to extract only the renovation work items from the transcript.
+1. Ignore all timestamps (e.g., [00:00:00]), speaker names, and small talk.
+2. Focus on the actual scope of work requested (e.g., hacking, flooring, carpentry).
+3. Return ONLY a valid JSON list of objects with "description" and "location" keys.
+4. Do not just copy the transcript lines. Extract the underlying items.
+5. "location" is the room or area the work is for (e.g. "Kitchen", "Master Bedroom"), or "General" if none is said.
+
+Example Input:
+"I want to hack the kitchen wall and do vinyl flooring for the whole house."
+Example Output:
+[{{"description": "Hacking of kitchen wall", "location": "Kitchen"}},
+ {{"description": "Supply and lay vinyl flooring", "location": "General"}}]
+"""),
+    ("user", "{transcript}")
+])
+EXTRACTOR_PROMPT_VERSION = llm_cache.prompt_version(EXTRACTOR_PROMPT)
 
 def parse_json_markdown(text):
     """
@@ -20,6 +65,121 @@ def parse_json_markdown(text):
         # Try raw
         return json.loads(text.strip())
 
+def clean_transcript(text: str) -> List[str]:
+    """
+    Strips timestamps, speaker headers and section headings from a meeting
+    transcript and returns one entry per utterance. For structured meeting
+    transcripts, utterances made up only of greetings, thanks and goodbyes
+    (SMALL_TALK_RE) are dropped; everything else is left for the model.
+    """
+    utterances = []
+    current = []
+    is_meeting = False
+
+    for line in text.split("\n"):
+        stripped = TIMESTAMP_RE.sub("", line).strip()
+        if stripped != line.strip():
+            is_meeting = True
+
+        # Blank line or new speaker ends the current utterance
+        if not stripped or SPEAKER_HEADER_RE.match(stripped) or SECTION_HEADING_RE.match(stripped):
+            if stripped:
+                is_meeting = True
+            if current:
+                utterances.append("\n".join(current))
+                current = []
+            continue
+
+        current.append(SPEAKER_PREFIX_RE.sub("", stripped))
+
+    if current:
+        utterances.append("\n".join(current))
+
+    if not is_meeting:
+        return utterances
+
+    scoped = [u for u in utterances if not SMALL_TALK_RE.match(u)]
+    # Never filter everything away; let the LLM decide instead
+    return scoped or utterances
+
+def chunk_utterances(utterances: List[str], chunk_chars: int = None, overlap: int = None) -> List[str]:
+    """
+    Packs utterances into windows of at most chunk_chars characters. Each window
+    repeats the last `overlap` utterances of the previous one so items discussed
+    across a boundary keep their context.
+    """
+    chunk_chars = chunk_chars or EXTRACTOR_CHUNK_CHARS
+    overlap = EXTRACTOR_CHUNK_OVERLAP if overlap is None else overlap
+
+    chunks = []
+    window: List[str] = []
+    size = 0
+    fresh = 0 # utterances in the window not already sent in a previous chunk
+    for utterance in utterances:
+        if window and size + len(utterance) > chunk_chars:
+            chunks.append("\n\n".join(window))
+            window = window[-overlap:] if overlap else []
+            size = sum(len(u) + 2 for u in window)
+            fresh = 0
+        window.append(utterance)
+        size += len(utterance) + 2
+        fresh += 1
+    if fresh:
+        chunks.append("\n\n".join(window))
+    return chunks
+
+def parse_extracted_items(raw_output: str) -> List[ExtractedItem]:
+    extracted_items = parse_json_markdown(raw_output)
+    
+    if not isinstance(extracted_items, list):
+        # If it's a single dict, wrap in list
+        if isinstance(extracted_items, dict):
+             extracted_items = [extracted_items]
+        else:
+             raise ValueError("Output is not a list")
+
+    # Convert to ExtractedItem objects
+    final_items = []
+    for item in extracted_items:
+        if isinstance(item, str):
+            final_items.append(ExtractedItem(
+                description=item,
+                quantity=1.0,
+                unit='lot',
+                location='General'
+            ))
+        else:
+            final_items.append(ExtractedItem(
+                description=item.get('description', 'Unknown Item'),
+                quantity=float(item.get('quantity') or 1.0),
+                unit=item.get('unit') or 'lot',
+                location=item.get('location') or 'General'
+            ))
+    return final_items
+
+def merge_extracted_items(chunk_items: List[List[ExtractedItem]], overlap: int = None) -> List[ExtractedItem]:
+    """
+    Concatenates per-chunk results. When windows overlap, an item is dropped if the
+    previous window already produced it (once per occurrence there), since it most
+    likely comes from the repeated utterances; repeats within a window are kept.
+    """
+    overlap = EXTRACTOR_CHUNK_OVERLAP if overlap is None else overlap
+    key = lambda item: (normalize(item.description), normalize(item.location or ""))
+
+    merged = []
+    previous: Dict[Any, int] = {}
+    for items in chunk_items:
+        carried = dict(previous) if overlap else {}
+        for item in items:
+            if carried.get(key(item)):
+                carried[key(item)] -= 1
+                continue
+            merged.append(item)
+        previous = {}
+        for item in items:
+            previous[key(item)] = previous.get(key(item), 0) + 1
+    return merged
+
 def extractor_node(state: RenovationState) -> Dict[str, Any]:
     print("--- EXTRACTOR NODE ---")
     raw_input = state.get('raw_items', [])
@@ -33,63 +193,53 @@ def extractor_node(state: RenovationState) -> Dict[str, Any]:
     if not transcript_text.strip():
         return {"raw_items": []}
 
-    print(f"Extracting items from transcript ({len(transcript_text)} chars)...")
+    chunks = chunk_utterances(clean_transcript(transcript_text))
+    print(f"Extracting items from transcript ({len(transcript_text)} chars, {len(chunks)} chunk(s))...")
 
-    llm = ChatGoogleGenerativeAI(model="gemini-3-pro-preview", temperature=0)
+    # Chunks seen before (re-quotes, retries, overlapping edits) skip the model
+    chunk_items: List[List[ExtractedItem]] = [None] * len(chunks)
+    for i, chunk in enumerate(chunks):
+        cached = llm_cache.get("extractor", EXTRACTOR_MODEL, EXTRACTOR_PROMPT_VERSION, chunk)
+        if cached is not None:
+            chunk_items[i] = [ExtractedItem(**item) for item in cached]
+    pending = [i for i, items in enumerate(chunk_items) if items is None]
+    if len(pending) < len(chunks):
+        print(f"Extractor cache: {len(chunks) - len(pending)}/{len(chunks)} chunk(s) cached.")
     
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert renovation quantity surveyor.
-Your task is to extract only the renovation work items from the transcript.
-1. Ignore all timestamps (e.g., [00:00:00]), speaker names, and small talk.
-2. Focus on the actual scope of work requested (e.g., hacking, flooring, carpentry).
-3. Return ONLY a valid JSON list of strings.
-4. Do not just copy the transcript lines. Extract the underlying items.
-
-Example Input:
-"I want to hack the kitchen wall and do vinyl flooring."
-Example Output:
-["Hacking of kitchen wall", "Supply and lay vinyl flooring"]
-"""),
-        ("user", "{transcript}")
-    ])
-    
-    # Use StrOutputParser to get raw text, then handle JSON manually
-    chain = prompt | llm | StrOutputParser()
-    
-    try:
-        raw_output = chain.invoke({"transcript": transcript_text})
-        print(f"LLM Raw Output: {raw_output[:100]}...") # Debug print
-        extracted_items = parse_json_markdown(raw_output)
+    if pending:
+        llm = get_llm(EXTRACTOR_MODEL)
+        
+        # Use StrOutputParser to get raw text, then handle JSON manually
+        chain = EXTRACTOR_PROMPT | llm | StrOutputParser()
         
-        if not isinstance(extracted_items, list):
-            # If it's a single dict, wrap in list
-            if isinstance(extracted_items, dict):
-                 extracted_items = [extracted_items]
-            else:
-                 raise ValueError("Output is not a list")
-
-        # Convert to ExtractedItem objects
-        from state import ExtractedItem
-        final_items = []
-        for item in extracted_items:
-            if isinstance(item, str):
-                final_items.append(ExtractedItem(
-                    description=item,
-                    quantity=1.0,
-                    unit='lot',
-                    location='General'
-                ))
-            else:
-                final_items.append(ExtractedItem(
-                    description=item.get('description', 'Unknown Item'),
-                    quantity=float(item.get('quantity', 1.0)),
-                    unit=item.get('unit', 'lot'),
-                    location=item.get('location', 'General')
-                ))
+        # Extract every remaining chunk concurrently (bounded), keeping chunk order for the merge
+        outputs = chain.batch(
+            [{"transcript": chunks[i]} for i in pending],
+            config={"max_concurrency": EXTRACTOR_MAX_CONCURRENCY},
+            return_exceptions=True
+        )
         
-        print(f"Extracted {len(final_items)} items.")
-        return {"raw_items": final_items}
-    except Exception as e:
-        print(f"Error in extractor: {e}")
-        # Fallback: return original split by newline if LLM fails
-        return {"raw_items": [line.strip() for line in transcript_text.split('\n') if line.strip()]}
+        for i, raw_output in zip(pending, outputs):
+            if isinstance(raw_output, MissingFixtureError):
+                # Replay mode: no line-split fallback for an unrecorded prompt
+                raise raw_output
+            try:
+                if isinstance(raw_output, Exception):
+                    raise raw_output
+                print(f"LLM Raw Output [{i + 1}/{len(chunks)}]: {raw_output[:100]}...") # Debug print
+                chunk_items[i] = parse_extracted_items(raw_output)
+                llm_cache.put("extractor", EXTRACTOR_MODEL, EXTRACTOR_PROMPT_VERSION, chunks[i],
+                              [item.model_dump() for item in chunk_items[i]])
+            except Exception as e:
+                print(f"Error in extractor (chunk {i + 1}/{len(chunks)}): {e}")
+    
+    failed = sum(1 for items in chunk_items if items is None)
+    
+    if failed:
+        # A quotation missing some or all of the scope must not be saved as complete; raising
+        # lets the job queue retry (successful chunks are cached, so only the failed ones rerun)
+        raise RuntimeError(f"Extraction failed for {failed}/{len(chunks)} transcript chunk(s)")
+    
+    final_items = merge_extracted_items(chunk_items)
+    print(f"Extracted {len(final_items)} items.")
+    return {"raw_items": final_items}
@@ -1,17 +1,223 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from state import RenovationState, QuotationItem, SuspenseItem
-from thefuzz import process, fuzz
-import psycopg2
 import os
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+from langgraph.config import get_stream_writer
+from db import get_connection
+from match_index import get_match_index, normalize, rank_shortlist, VariantFilter, VARIANT_ORDER
+from metrics import db_span, scoring_span, count_item
 
 load_dotenv()
 
 CONFIDENCE_THRESHOLD = 98
 
-def get_db_connection():
-    return psycopg2.connect(os.getenv("DATABASE_URL"))
+# "memory": score against the cached per-tenant MatchIndex
+# "pg_trgm": shortlist candidates in Postgres with pg_trgm, re-rank the shortlist in Python
+# "tfidf": character n-gram TF-IDF cosine top-k on the MatchIndex, blended with the fuzzy score
+# Tenants can override this with tenants.config: {"matcher_backend": "tfidf", "tfidf_blend": 0.6}
+MATCHER_BACKEND = os.getenv("MATCHER_BACKEND", "memory")
+MATCHER_BACKENDS = ("memory", "pg_trgm", "tfidf")
+PG_TRGM_CANDIDATES = int(os.getenv("MATCH_PG_CANDIDATES", "50"))
+PG_TRGM_SIMILARITY = float(os.getenv("MATCH_PG_SIMILARITY", "0.1"))
+
+def build_quotation_item(item, item_data: Dict[str, Any], score: float) -> QuotationItem:
+    # For now, we use the price list unit for pricing consistency,
+    # but we use the extracted quantity.
+    return QuotationItem(
+        description=item_data['description'],
+        quantity=item.quantity, # Use extracted quantity
+        unit=item_data['unit'], # Use price list unit
+        unit_price=float(item_data['unit_price']),
+        subtotal=float(item_data['unit_price']) * item.quantity, 
+        confidence_score=float(score),
+        price_list_id=str(item_data['id']),
+        is_suspense=False,
+        location=item.location
+    )
+
+def tenant_matcher_settings(cur, tenant_id: str) -> Tuple[str, Optional[float]]:
+    """The tenant's matcher backend and TF-IDF blend from tenants.config, defaulting to MATCHER_BACKEND."""
+    with db_span("tenant_settings"):
+        cur.execute("""
+            SELECT config->>'matcher_backend' AS backend, config->>'tfidf_blend' AS blend
+            FROM tenants WHERE id = %s
+        """, (tenant_id,))
+        res = cur.fetchone() or {}
+    backend = res.get('backend') or MATCHER_BACKEND
+    if backend not in MATCHER_BACKENDS:
+        print(f"Unknown matcher backend '{backend}' for tenant {tenant_id}, using {MATCHER_BACKEND}")
+        backend = MATCHER_BACKEND
+    try:
+        blend = float(res['blend']) if res.get('blend') else None
+    except ValueError:
+        blend = None
+    return backend, blend
+
+def match_in_memory(cur, tenant_id: str, descriptions: List[str],
+                    property_type: Optional[str] = None, locations: Optional[List[Optional[str]]] = None):
+    """
+    Returns (alias_hits, matches): per description, the verified alias item (or None)
+    and the top 3 fuzzy matches as (text, score, price_list_item).
+    Candidates are first narrowed to the property type and each item's location
+    (see MatchIndex.filter_mask).
+    """
+    with db_span("match_index"):
+        index = get_match_index(cur, tenant_id)
+    with scoring_span("memory"):
+        return match_with_index(index, index.extract_batch, descriptions, property_type, locations)
+
+def match_tfidf(cur, tenant_id: str, descriptions: List[str],
+                property_type: Optional[str] = None, locations: Optional[List[Optional[str]]] = None,
+                blend: Optional[float] = None):
+    """Same contract as match_in_memory, ranked by MatchIndex.extract_tfidf."""
+    with db_span("match_index"):
+        index = get_match_index(cur, tenant_id)
+    extract = lambda queries, limit, mask: index.extract_tfidf(queries, limit=limit, mask=mask, blend=blend)
+    with scoring_span("tfidf"):
+        return match_with_index(index, extract, descriptions, property_type, locations)
+
+def match_with_index(index, extract, descriptions: List[str],
+                     property_type: Optional[str] = None, locations: Optional[List[Optional[str]]] = None):
+    """Alias lookup plus extract(queries, limit=, mask=) per location group, for the MatchIndex backends."""
+    locations = locations or [None] * len(descriptions)
+    
+    # Verified alias hits need no fuzzy scoring; batch-score everything else,
+    # one batch per distinct location (items sharing a location share a filter)
+    alias_hits = [index.exact_alias(d) for d in descriptions]
+    groups: Dict[Optional[str], List[int]] = {}
+    for i, (location, hit) in enumerate(zip(locations, alias_hits)):
+        if not hit:
+            groups.setdefault(location, []).append(i)
+
+    matches = [[] for _ in descriptions]
+    for location, positions in groups.items():
+        mask = index.filter_mask(property_type, location)
+        batch = extract([descriptions[i] for i in positions], limit=3, mask=mask)
+        for i, ranked in zip(positions, batch):
+            ranked = [(text, score, index.choice_items[c]) for text, score, c in ranked]
+            variants = index.description_variants(ranked[0][2]['description'], mask) if ranked else []
+            matches[i] = order_variants(ranked, variants, property_type)
+    return alias_hits, matches
+
+def fetch_pg_trgm_candidates(cur, tenant_id: str, descriptions: List[str]) -> List[List[Dict[str, Any]]]:
+    """
+    Shortlists price list descriptions and aliases for all descriptions in a single
+    query using the pg_trgm GIN indexes. Expects a RealDictCursor. Each shortlist
+    comes back by similarity, ties in VARIANT_ORDER (the in-memory index's order).
+    """
+    cur.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", (str(PG_TRGM_SIMILARITY),))
+    cur.execute("""
+        WITH q AS (
+            SELECT t.query_text, t.ord
+            FROM unnest(%(queries)s::text[]) WITH ORDINALITY AS t(query_text, ord)
+        )
+        SELECT q.ord, c.*
+        FROM q
+        CROSS JOIN LATERAL (
+            (SELECT p.description AS choice_text, FALSE AS is_verified,
+                    p.id, p.description, p.unit, p.unit_price, p.property_type, p.area, p.list_order,
+                    similarity(p.description, q.query_text) AS sim
+             FROM price_lists p
+             WHERE p.tenant_id = %(tenant_id)s AND p.is_active AND p.description %% q.query_text
+             ORDER BY sim DESC, {p_order}
+             LIMIT %(limit)s)
+            UNION ALL
+            (SELECT a.alias_text, a.is_verified,
+                    p.id, p.description, p.unit, p.unit_price, p.property_type, p.area, p.list_order,
+                    similarity(a.alias_text, q.query_text) AS sim
+             FROM product_aliases a
+             JOIN price_lists p ON p.id = a.price_list_id
+             WHERE a.tenant_id = %(tenant_id)s AND p.is_active AND a.alias_text %% q.query_text
+             ORDER BY sim DESC, a.id
+             LIMIT %(limit)s)
+        ) c
+        ORDER BY q.ord, c.sim DESC, {c_order}
+    """.format(p_order=VARIANT_ORDER.format(t="p."), c_order=VARIANT_ORDER.format(t="c.")),
+        {"queries": descriptions, "tenant_id": tenant_id, "limit": PG_TRGM_CANDIDATES})
+    
+    candidates = [[] for _ in descriptions]
+    for row in cur.fetchall():
+        candidates[row['ord'] - 1].append(row)
+    return candidates
+
+def match_pg_trgm(cur, tenant_id: str, descriptions: List[str],
+                  property_type: Optional[str] = None, locations: Optional[List[Optional[str]]] = None):
+    """Same contract as match_in_memory, with the candidate search pushed into Postgres."""
+    alias_hits = []
+    matches = []
+    locations = locations or [None] * len(descriptions)
+    with db_span("pg_trgm_candidates"):
+        shortlists = fetch_pg_trgm_candidates(cur, tenant_id, descriptions)
+    with scoring_span("pg_trgm"):
+        for description, location, shortlist in zip(descriptions, locations, shortlists):
+            normalized = normalize(description)
+            hit = next((c for c in shortlist if c['is_verified'] and normalize(c['choice_text']) == normalized), None)
+            alias_hits.append(hit)
+            if hit:
+                matches.append([])
+                continue
+            # Same property type/area pre-filter as the in-memory index, applied to the shortlist
+            mask = VariantFilter(shortlist).mask(property_type, location)
+            if mask is not None:
+                shortlist = [c for c, keep in zip(shortlist, mask) if keep]
+            ranked = rank_shortlist(description, [c['choice_text'] for c in shortlist], limit=3)
+            ranked = [(text, score, shortlist[i]) for text, score, i in ranked]
+            variants = [c for c in shortlist if ranked and c['description'] == ranked[0][2]['description']]
+            matches.append(order_variants(ranked, variants, property_type))
+    return alias_hits, matches
+
+def preferred_variants(variants, property_type: Optional[str] = None):
+    """The variants for the quotation's own property type if there are any, else all of them (in VARIANT_ORDER)."""
+    if property_type:
+        own = [v for v in variants if (v.get('property_type') or 'All').casefold() == property_type.casefold()]
+        if own:
+            return own
+    return variants
+
+def order_variants(matches, variants, property_type: Optional[str] = None):
+    """
+    When the top match is a description priced per variant (same text, same score),
+    puts the preferred variant first and makes sure a differently priced one is among
+    the top 3 matches, even if same-priced twins ranked ahead of it. variants are the
+    items under the top match's description that passed the property type/area filter.
+    """
+    if not matches:
+        return matches
+    text, score, best = matches[0]
+    if text != best['description']:
+        # Top match came in through an alias; its variants score on their own text
+        return matches
+    preferred = preferred_variants(variants, property_type) or [best]
+    pick = preferred[0]
+    other = next((v for v in preferred if float(v['unit_price']) != float(pick['unit_price'])), None)
+    ordered = [(text, score, pick)] + ([(other['description'], score, other)] if other else [])
+    return (ordered + [m for m in matches[1:] if m[2] is not pick and m[2] is not other])[:3]
+
+def tied_variant_prices(matches, property_type: Optional[str] = None) -> bool:
+    """
+    True when the top score is shared by preferred variants of the same description
+    priced differently (e.g. HDB vs Landed with no property type given), so picking
+    one would be a guess.
+    """
+    if len(matches) < 2:
+        return False
+    best_score, best_item = matches[0][1], matches[0][2]
+    tied = [item for _, score, item in matches
+            if score == best_score and item['description'] == best_item['description']]
+    return len({float(item['unit_price']) for item in preferred_variants(tied, property_type)}) > 1
+
+def best_match_summary(match) -> Dict[str, Any]:
+    text, score, item = match
+    return {"text": text, "score": score, "id": str(item['id']),
+            "property_type": item.get('property_type'), "area": item.get('area')}
+
+def progress_writer():
+    """Emits custom stream events when the graph is streamed with stream_mode="custom"; no-op otherwise."""
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return lambda event: None
 
 def matcher_node(state: RenovationState) -> Dict[str, Any]:
     print("--- MATCHER NODE ---")
@@ -24,96 +230,67 @@ def matcher_node(state: RenovationState) -> Dict[str, Any]:
     if not raw_items:
         return {"matched_items": matched_items, "suspense_items": suspense_items}
 
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    emit = progress_writer()
 
-    try:
-        # 1. Fetch Price List items for this Tenant
-        cur.execute("""
-            SELECT id, description, unit, unit_price 
-            FROM price_lists 
-            WHERE tenant_id = %s
-        """, (tenant_id,))
-        price_list_items = cur.fetchall()
-        
-        # 2. Fetch Aliases for this Tenant (Phase 3 Prep)
-        cur.execute("""
-            SELECT alias_text, price_list_id 
-            FROM product_aliases 
-            WHERE tenant_id = %s
-        """, (tenant_id,))
-        aliases = cur.fetchall()
-        
-        # Map IDs to items for easy lookup
-        # Choices for fuzzy search: description + alias_text
-        # Map IDs to items for easy lookup
-        # Choices for fuzzy search: description + alias_text
-        choices_map = {} # item_text -> price_list_item_dict
-        choices_list = []
+    with get_connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+
+        try:
+            # 1. Shortlist and score candidates with the configured backend
+            # narrowed to the quotation's property type and each item's location
+            descriptions = [item.description for item in raw_items]
+            locations = [item.location for item in raw_items]
+            property_type = state.get('property_type')
+            backend, blend = tenant_matcher_settings(cur, tenant_id)
+            if backend == "pg_trgm":
+                alias_hits, all_matches = match_pg_trgm(cur, tenant_id, descriptions, property_type, locations)
+            elif backend == "tfidf":
+                alias_hits, all_matches = match_tfidf(cur, tenant_id, descriptions, property_type, locations, blend)
+            else:
+                alias_hits, all_matches = match_in_memory(cur, tenant_id, descriptions, property_type, locations)
         
-        for item in price_list_items:
-            desc = item['description']
-            choices_map[desc] = item
-            choices_list.append(desc)
+            for item, alias_item, matches in zip(raw_items, alias_hits, all_matches):
+                raw_text = item.description # Fuzzy match on description
+                print(f"Matching: {raw_text}")
             
-        # Incorporate aliases
-        for alias in aliases:
-            text = alias['alias_text']
-            pl_id = alias['price_list_id']
-            # Find the original item
-            # We can traverse price_list_items again or key them by ID first.
-            # Efficient way: Dict by ID
+                # 2. Verified alias hit
+                if alias_item:
+                    print(f"  Matched alias: {alias_item['description']} (100%)")
+                    matched_items.append(build_quotation_item(item, alias_item, 100))
+                    count_item("alias")
+                    emit({"event": "match", "item": matched_items[-1].model_dump()})
+                    continue
             
-            # For simplicity, let's find the item in price_list_items linked to this alias
-            linked_item = next((i for i in price_list_items if i['id'] == pl_id), None)
-            if linked_item:
-                choices_map[text] = linked_item # Map alias text to the ACTUAL item data
-                choices_list.append(text)
-        
-        for item in raw_items:
-            raw_text = item.description # Fuzzy match on description
-            print(f"Matching: {raw_text}")
-            
-            # Simple matching on description for now
-            # Extract top 3 matches
-            matches = process.extract(raw_text, choices_list, limit=3, scorer=fuzz.token_sort_ratio)
+                # 3. Best of the top 3 matches (fuzzy, or cosine/fuzzy blend on tfidf)
+                best_match = matches[0] if matches else None
             
-            best_match = matches[0] if matches else None
+                # Same text priced per variant with nothing to pick one: leave it to a reviewer
+                ambiguous = tied_variant_prices(matches, property_type)
             
-            if best_match and best_match[1] >= CONFIDENCE_THRESHOLD:
-                print(f"  Matched: {best_match[0]} ({best_match[1]}%)")
-                item_data = choices_map[best_match[0]]
-                
-                # Use extracted quantity and unit if available/different?
-                # For now, we use the price list unit for pricing consistency,
-                # but we use the extracted quantity.
-                
-                quotation_item = QuotationItem(
-                    description=item_data['description'],
-                    quantity=item.quantity, # Use extracted quantity
-                    unit=item_data['unit'], # Use price list unit
-                    unit_price=float(item_data['unit_price']),
-                    subtotal=float(item_data['unit_price']) * item.quantity, 
-                    confidence_score=float(best_match[1]),
-                    price_list_id=str(item_data['id']),
-                    is_suspense=False,
-                    location=item.location
-                )
-                matched_items.append(quotation_item)
-            else:
-                print(f"  Suspense: {raw_text} (Best: {best_match})")
-                suspense_item = SuspenseItem(
-                    raw_text=raw_text, # Keep original description
-                    best_matches=[{"text": m[0], "score": m[1]} for m in matches],
-                    confidence_score=float(best_match[1]) if best_match else 0.0
-                )
-                suspense_items.append(suspense_item)
-
-    except Exception as e:
-        print(f"Error in matcher: {e}")
-        # In production, handle error gracefully
-    finally:
-        cur.close()
-        conn.close()
+                if best_match and best_match[1] >= CONFIDENCE_THRESHOLD and not ambiguous:
+                    print(f"  Matched: {best_match[0]} ({best_match[1]}%)")
+                    matched_items.append(build_quotation_item(item, best_match[2], best_match[1]))
+                    count_item("matched")
+                    emit({"event": "match", "item": matched_items[-1].model_dump()})
+                else:
+                    reason = " (variants priced differently)" if ambiguous else ""
+                    print(f"  Suspense: {raw_text} (Best: {best_match[:2] if best_match else None}){reason}")
+                    suspense_item = SuspenseItem(
+                        raw_text=raw_text, # Keep original description
+                        best_matches=[best_match_summary(m) for m in matches],
+                        confidence_score=float(best_match[1]) if best_match else 0.0,
+                        quantity=item.quantity,
+                        unit=item.unit,
+                        location=item.location
+                    )
+                    suspense_items.append(suspense_item)
+                    count_item("suspense")
+                    emit({"event": "suspense", "item": suspense_item.model_dump()})
+
+        except Exception as e:
+            print(f"Error in matcher: {e}")
+            # In production, handle error gracefully
+        finally:
+            cur.close()
         
     return {"matched_items": matched_items, "suspense_items": suspense_items}
@@ -0,0 +1,225 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+import uuid
+from psycopg2.extras import execute_values, Json, RealDictCursor
+from db import get_connection
+from graph import get_graph
+from match_index import get_match_index
+from nodes.matcher import tenant_matcher_settings
+import metrics
+
+# Graph runs in flight at once for process_batch (each mostly waits on the LLM).
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+
+
+def quotation_inputs(transcript: str, tenant_id: str, property_type: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "raw_items": [transcript],
+        # Phase 5: Pass full transcript to Extractor Node
+        "tenant_id": str(tenant_id),
+        "session_id": str(uuid.uuid4()),
+        "property_type": property_type
+    }
+
+
+def run_quotation_graph(transcript: str, tenant_id: str, property_type: Optional[str] = None) -> Dict[str, Any]:
+    """Runs the compiled graph over one transcript. No DB connection is held meanwhile."""
+    start = time.perf_counter()
+    result = get_graph().invoke(quotation_inputs(transcript, tenant_id, property_type))
+    return with_total_time(result, time.perf_counter() - start)
+
+
+def with_total_time(result: Dict[str, Any], seconds: float) -> Dict[str, Any]:
+    """Records the run's wall time in metrics and in result["timings"]["total_ms"]."""
+    metrics.observe_graph(seconds)
+    result["timings"] = dict(result.get("timings") or {}, total_ms=round(seconds * 1000, 1))
+    return result
+
+
+def _dump(item) -> Any:
+    return item.model_dump() if hasattr(item, "model_dump") else item
+
+
+def progress_event(node: str, update: Dict[str, Any]):
+    """Maps one node's state update to a client-facing (event, data) pair, or None."""
+    update = update or {}
+    if node in ("heuristic_guard", "llm_guard"):
+        error = update.get("error")
+        return "guard", {"stage": node, "verdict": "UNSAFE" if error else "SAFE", "error": error}
+    if node == "extractor":
+        return "extracted", {"items": [_dump(i) for i in update.get("raw_items", [])]}
+    if node == "pricer" and update.get("quotation"):
+        return "total", {"total_amount": update["quotation"].total_amount}
+    if node == "validator" and update.get("validation_errors"):
+        return "validation", {"errors": update["validation_errors"]}
+    return None
+
+
+async def astream_quotation_graph(transcript: str, tenant_id: str,
+                                  property_type: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streams a graph run as (event, data) pairs: guard verdicts, extracted items,
+    each match/suspense decision from matcher_node, the total, and finally
+    ("result", final_state) for the caller to persist.
+    """
+    final_state: Dict[str, Any] = {}
+    start = time.perf_counter()
+    async for mode, chunk in get_graph().astream(
+        quotation_inputs(transcript, tenant_id, property_type),
+        stream_mode=["updates", "custom", "values"]
+    ):
+        if mode == "values":
+            final_state = chunk
+        elif mode == "custom":
+            yield chunk["event"], chunk["item"]
+        else:
+            for node, update in chunk.items():
+                event = progress_event(node, update)
+                if event:
+                    yield event
+    yield "result", with_total_time(dict(final_state), time.perf_counter() - start)
+
+
+def save_quotation_result(cur, quotation_id: str, result: Dict[str, Any]):
+    """Writes the graph result for a quotation. The caller owns the transaction."""
+    save_quotation_results(cur, [(quotation_id, result)])
+
+
+def save_quotation_results(cur, results: List[Tuple[str, Dict[str, Any]]]):
+    """
+    Writes graph results for many quotations: one UPDATE for the headers and one
+    INSERT for all line items, replacing any items already saved for them. The
+    caller owns the transaction.
+    """
+    if not results:
+        return
+
+    # Update status to completed, keeping the run's timing breakdown for forensics
+    headers = []
+    for quotation_id, result in results:
+        quotation = result.get('quotation')
+        timings = result.get('timings')
+        headers.append((quotation_id, quotation.total_amount if quotation else 0.0, Json(timings) if timings else None))
+    execute_values(cur, """
+        UPDATE quotations AS q
+        SET total_amount = v.total_amount, status = 'completed', timings = v.timings
+        FROM (VALUES %s) AS v (id, total_amount, timings)
+        WHERE q.id = v.id
+    """, headers, template="(%s::uuid, %s::numeric, %s::jsonb)", page_size=500)
+
+    # Save Items (Matched + Suspense) in one round trip
+    rows = []
+    for quotation_id, result in results:
+        for item in result.get('matched_items', []):
+            rows.append((
+                quotation_id, item.price_list_id, item.description, item.quantity, item.unit,
+                item.location, item.unit_price, item.confidence_score, False, None
+            ))
+        for item in result.get('suspense_items', []):
+            rows.append((
+                quotation_id, None, item.raw_text, item.quantity, item.unit,
+                item.location, 0, item.confidence_score, True, Json(item.best_matches)
+            ))
+
+    # Replace, not append: a retried job may re-save a quotation whose earlier run wrote items
+    cur.execute("DELETE FROM quotation_items WHERE quotation_id = ANY(%s::uuid[])",
+                ([quotation_id for quotation_id, _ in results],))
+    if rows:
+        execute_values(cur, """
+            INSERT INTO quotation_items
+                (quotation_id, price_list_id, description, quantity, unit, location, unit_price, confidence_score, is_suspense, best_matches)
+            VALUES %s
+        """, rows, page_size=500)
+
+
+def persist_quotation_result(quotation_id: str, result: Dict[str, Any]):
+    """save_quotation_result in its own transaction, for callers outside the job queue."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            save_quotation_result(cur, quotation_id, result)
+        conn.commit()
+
+
+def mark_quotation_failed(quotation_id: str):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE quotations SET status = 'failed' WHERE id = %s", (quotation_id,))
+        conn.commit()
+
+
+def process_batch(transcripts: List[str], tenant_id: str, client_name: str = "Batch",
+                  max_workers: Optional[int] = None, property_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Quotes many transcripts for one tenant in this process: one tenant match index
+    build shared by every run, graph runs spread over a thread pool, and all
+    quotations, line items and failures written in bulk in a single transaction.
+    If the run is interrupted or that write fails, the batch's quotations are
+    marked failed rather than left 'processing'. Returns one {"quotation_id", "status", "total_amount", "error"} per transcript, in order.
+    """
+    if not transcripts:
+        return []
+    tenant_id = str(tenant_id)
+    quotation_ids = [str(uuid.uuid4()) for _ in transcripts]
+
+    # 1. Create the quotation rows and warm the tenant's match index once
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            execute_values(cur, """
+                INSERT INTO quotations (id, tenant_id, client_name, status)
+                VALUES %s
+            """, [(qid, tenant_id, client_name, 'processing') for qid in quotation_ids], page_size=500)
+            backend, _ = tenant_matcher_settings(cur, tenant_id)
+            if backend != "pg_trgm":
+                index = get_match_index(cur, tenant_id)
+                if backend == "tfidf":
+                    index.tfidf_vectors()
+        conn.commit()
+
+    written = False
+    try:
+        # 2. Run the graphs concurrently (no DB connection held by this thread meanwhile)
+        def run(transcript):
+            try:
+                return run_quotation_graph(transcript, tenant_id, property_type), None
+            except Exception as e:
+                return None, str(e)
+
+        with ThreadPoolExecutor(max_workers=max_workers or BATCH_MAX_WORKERS) as pool:
+            outcomes = list(pool.map(run, transcripts))
+
+        # 3. Bulk write results
+        completed = [(qid, result) for qid, (result, _) in zip(quotation_ids, outcomes) if result is not None]
+        failed = [qid for qid, (result, _) in zip(quotation_ids, outcomes) if result is None]
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                save_quotation_results(cur, completed)
+                if failed:
+                    cur.execute("UPDATE quotations SET status = 'failed' WHERE id = ANY(%s::uuid[])", (failed,))
+            conn.commit()
+        written = True
+    finally:
+        if not written:
+            # Interrupted, or the final write failed: don't leave the batch 'processing' forever
+            try:
+                with get_connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute("""
+                            UPDATE quotations SET status = 'failed'
+                            WHERE id = ANY(%s::uuid[]) AND status = 'processing'
+                        """, (quotation_ids,))
+                    conn.commit()
+            except Exception as e:
+                print(f"Could not mark unsaved batch quotations as failed: {e}")
+
+    summary = []
+    for qid, (result, error) in zip(quotation_ids, outcomes):
+        quotation = result.get('quotation') if result else None
+        summary.append({
+            "quotation_id": qid,
+            "status": "completed" if result is not None else "failed",
+            "total_amount": quotation.total_amount if quotation else 0.0,
+            "error": error or (result or {}).get('error')
+        })
+    return summary
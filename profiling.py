@@ -0,0 +1,72 @@
+from contextlib import contextmanager
+from typing import Optional
+import os
+import random
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Opt-in sampling profiler (pyinstrument) for individual quotation runs.
+# A run is profiled when the request asks for it (X-Profile: 1 on POST /quotation,
+# manual_test.py --profile), when PROFILE_QUOTATIONS=true, or for a random
+# PROFILE_SAMPLE_RATE fraction of API quotations. The artifacts are written to
+# PROFILE_DIR keyed by quotation id:
+#
+#   <id>.html        flame/call-tree view (also served by GET /quotation/{id}/profile)
+#   <id>.pyisession  raw samples, re-render with `pyinstrument --load=<id>.pyisession`
+#
+# Only the thread running the graph is sampled; the LLM guard/extractor branch runs
+# in LangGraph's executor and shows up as waiting (quotations.timings has its split).
+
+PROFILE_QUOTATIONS = os.getenv("PROFILE_QUOTATIONS", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Sampling interval; 1 ms keeps overhead to a few percent of a quotation run.
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+# Shared storage (e.g. a mounted volume) if the API should serve profiles written by workers.
+PROFILE_DIR = os.path.abspath(os.getenv("PROFILE_DIR", "profiles"))
+
+
+def should_profile(requested: bool = False) -> bool:
+    """Whether to profile a new quotation: on request, always, or sampled."""
+    return requested or PROFILE_QUOTATIONS or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+
+def profile_path(quotation_id: str, ext: str = "html") -> str:
+    # Parsed as a UUID so a request path can never point outside PROFILE_DIR
+    return os.path.join(PROFILE_DIR, f"{uuid.UUID(str(quotation_id))}.{ext}")
+
+
+@contextmanager
+def profiled(quotation_id: str, enabled: bool = True):
+    """Runs the block under pyinstrument and saves the profile for quotation_id; a no-op when disabled."""
+    if not enabled:
+        yield None
+        return
+
+    # Imported here so unprofiled runs never load the profiler
+    from pyinstrument import Profiler
+    profiler = Profiler(interval=PROFILE_INTERVAL_MS / 1000)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(profile_path(quotation_id), "w", encoding="utf-8") as fh:
+                fh.write(profiler.output_html())
+            profiler.last_session.save(profile_path(quotation_id, "pyisession"))
+            print(f"Profile for {quotation_id} written to {profile_path(quotation_id)}")
+        except Exception as e:
+            # Profiling must never fail the quotation itself
+            print(f"Could not save profile for {quotation_id}: {e}")
+
+
+def find_profile(quotation_id: str) -> Optional[str]:
+    """Path of the stored HTML profile, or None."""
+    try:
+        path = profile_path(quotation_id)
+    except ValueError:
+        return None
+    return path if os.path.exists(path) else None
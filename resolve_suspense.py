@@ -1,86 +1,107 @@
 import sys
 import psycopg2
-import os
 from dotenv import load_dotenv
+from db import get_connection
+from match_index import bump_catalog_version, VARIANT_ORDER
 from thefuzz import process
 
 load_dotenv()
 
-def get_db_connection():
-    return psycopg2.connect(os.getenv("DATABASE_URL"))
+def describe_variant(item):
+    """'<description>' (HDB / Kitchen, $350.00) for a (id, description, unit_price, property_type, area) row."""
+    return f"'{item[1]}' ({item[3]} / {item[4]}, ${float(item[2]):.2f})"
+
+def choose_variant(cur, tenant_id, description):
+    """
+    The description is priced per variant (property type / area); an alias points at
+    exactly one row, so the user picks which. Rows are listed in VARIANT_ORDER.
+    """
+    cur.execute("""
+        SELECT id, description, unit_price, property_type, area FROM price_lists
+        WHERE tenant_id = %s AND is_active AND description = %s
+        ORDER BY {}
+    """.format(VARIANT_ORDER.format(t="")), (tenant_id, description))
+    variants = cur.fetchall()
+    if len(variants) <= 1:
+        return variants[0] if variants else None
+
+    print("This item is priced per variant; the alias will always use the one you pick:")
+    for i, item in enumerate(variants, 1):
+        print(f"  [{i}] {describe_variant(item)}")
+    print(f"Variant [1-{len(variants)}]:")
+    choice = input().strip()
+    if not choice.isdigit() or not 1 <= int(choice) <= len(variants):
+        return None
+    return variants[int(choice) - 1]
 
 def resolve_suspense(suspense_text, target_query, tenant_name="Homeez"):
-    conn = get_db_connection()
-    cur = conn.cursor()
+    with get_connection() as conn:
+        cur = conn.cursor()
     
-    try:
-        # 1. Get Tenant ID
-        cur.execute("SELECT id FROM tenants WHERE name = %s", (tenant_name,))
-        res = cur.fetchone()
-        if not res:
-            print(f"Tenant '{tenant_name}' not found.")
-            return
-        tenant_id = res[0]
+        try:
+            # 1. Get Tenant ID
+            cur.execute("SELECT id FROM tenants WHERE name = %s", (tenant_name,))
+            res = cur.fetchone()
+            if not res:
+                print(f"Tenant '{tenant_name}' not found.")
+                return
+            tenant_id = res[0]
         
-        # 2. Find the target price list item
-        # We allow target_query to be an ID OR a partial description search
-        # Try ID first (UUID format)
-        target_item = None
+            # 2. Find the target price list item
+            # We allow target_query to be an ID OR a partial description search
+            # Try ID first (UUID format)
+            target_item = None
         
-        try:
-            # Check if valid UUID
-            uuid_query = "SELECT id, description, unit_price FROM price_lists WHERE id = %s AND tenant_id = %s"
-            cur.execute(uuid_query, (target_query, tenant_id))
-            target_item = cur.fetchone()
-        except psycopg2.Error:
-            conn.rollback() # Not a UUID, ignore error
-            
-        if not target_item:
-            # Search by description
-            print(f"Searching for '{target_query}' in price list...")
-            cur.execute("SELECT id, description FROM price_lists WHERE tenant_id = %s", (tenant_id,))
-            all_items = cur.fetchall() # [(id, desc), ...]
+            try:
+                # Check if valid UUID
+                uuid_query = "SELECT id, description, unit_price, property_type, area FROM price_lists WHERE id = %s AND tenant_id = %s AND is_active"
+                cur.execute(uuid_query, (target_query, tenant_id))
+                target_item = cur.fetchone()
+            except psycopg2.Error:
+                conn.rollback() # Not a UUID, ignore error
             
-            choices = [item[1] for item in all_items]
-            best_match = process.extractOne(target_query, choices)
+            if not target_item:
+                # Search by description
+                print(f"Searching for '{target_query}' in price list...")
+                cur.execute("""
+                    SELECT description FROM price_lists WHERE tenant_id = %s AND is_active
+                    GROUP BY description ORDER BY min(list_order)
+                """, (tenant_id,))
+                choices = [row[0] for row in cur.fetchall()]
+                best_match = process.extractOne(target_query, choices)
             
-            if best_match:
-                print(f"Did you mean: '{best_match[0]}' (Score: {best_match[1]})? [y/N]")
-                user_input = input().lower()
-                if user_input == 'y':
-                    # Find ID
-                    for item in all_items:
-                        if item[1] == best_match[0]:
-                            target_item = item
-                            break
+                if best_match:
+                    print(f"Did you mean: '{best_match[0]}' (Score: {best_match[1]})? [y/N]")
+                    user_input = input().lower()
+                    if user_input == 'y':
+                        target_item = choose_variant(cur, tenant_id, best_match[0])
             
-        if not target_item:
-            print("Could not find a matching price list item. Aborting.")
-            return
+            if not target_item:
+                print("Could not find a matching price list item. Aborting.")
+                return
 
-        target_id = target_item[0]
-        target_desc = target_item[1]
+            target_id = target_item[0]
         
-        print(f"\nCreating Alias:")
-        print(f"  '{suspense_text}' -> '{target_desc}'")
+            print(f"\nCreating Alias:")
+            print(f"  '{suspense_text}' -> {describe_variant(target_item)}")
         
-        # 3. Insert Alias
-        # Check if exists first
-        cur.execute("""
-            INSERT INTO product_aliases (tenant_id, alias_text, price_list_id, is_verified)
-            VALUES (%s, %s, %s, TRUE)
-            ON CONFLICT (tenant_id, alias_text) 
-            DO UPDATE SET price_list_id = EXCLUDED.price_list_id, is_verified = TRUE
-        """, (tenant_id, suspense_text, target_id))
+            # 3. Insert Alias
+            # Check if exists first
+            cur.execute("""
+                INSERT INTO product_aliases (tenant_id, alias_text, price_list_id, is_verified)
+                VALUES (%s, %s, %s, TRUE)
+                ON CONFLICT (tenant_id, alias_text) 
+                DO UPDATE SET price_list_id = EXCLUDED.price_list_id, is_verified = TRUE
+            """, (tenant_id, suspense_text, target_id))
+            bump_catalog_version(cur, tenant_id)
         
-        conn.commit()
-        print("\n✅ Alias successfully created! The agent will now recognize this term.")
+            conn.commit()
+            print("\n✅ Alias successfully created! The agent will now recognize this term.")
 
-    except Exception as e:
-        print(f"Error: {e}")
-    finally:
-        cur.close()
-        conn.close()
+        except Exception as e:
+            print(f"Error: {e}")
+        finally:
+            cur.close()
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
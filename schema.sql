@@ -1,11 +1,16 @@
 -- Enable UUID extension
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+-- Trigram similarity search for the pg_trgm matcher backend
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- Lets tenant_id (a plain UUID) share a GIN index with trigram columns
+CREATE EXTENSION IF NOT EXISTS btree_gin;
 
 -- Tenants Table
 CREATE TABLE tenants (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     name VARCHAR(255) NOT NULL,
     config JSONB DEFAULT '{}', -- Store tenant-specific configs here
+    catalog_version BIGINT NOT NULL DEFAULT 0, -- Bumped on price list / alias changes to invalidate matcher caches
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -18,9 +23,23 @@ CREATE TABLE price_lists (
     description TEXT NOT NULL,
     unit VARCHAR(50),
     unit_price NUMERIC(10, 2) NOT NULL,
+    -- Variant attributes from the price list ('All' when the row applies to every value)
+    property_type VARCHAR(50) NOT NULL DEFAULT 'All', -- HDB, Condo, Landed
+    property_status VARCHAR(100) NOT NULL DEFAULT 'All', -- new, resale
+    property_room VARCHAR(50) NOT NULL DEFAULT 'All', -- Flat type (2-room, EA, Penthouse...)
+    area VARCHAR(100) NOT NULL DEFAULT 'All', -- Kitchen, Toilet, Bedroom...
+    sub_category TEXT,
+    work_description TEXT,
+    -- Ingestion (file) order, kept by in-place delta updates; equal-scoring variants resolve to 'All', then the earliest
+    list_order BIGINT GENERATED BY DEFAULT AS IDENTITY,
     effective_date DATE DEFAULT CURRENT_DATE,
+    -- Rows dropped from a re-ingested price list are retired, not deleted, so aliases pointing at them survive
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    retired_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    CONSTRAINT unique_item_tenant UNIQUE (tenant_id, description) -- Description implies uniqueness per tenant for matching
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    -- The same description can be priced per property type/status/room/area
+    CONSTRAINT unique_item_tenant UNIQUE (tenant_id, description, property_type, property_status, property_room, area)
 );
 
 -- Product Aliases Table (Learning Loop)
@@ -42,7 +61,8 @@ CREATE TABLE quotations (
     session_id VARCHAR(255), -- For linking to the chat/voice session
     client_name VARCHAR(255),
     total_amount NUMERIC(12, 2),
-    status VARCHAR(50) DEFAULT 'draft', -- draft, finalized
+    status VARCHAR(50) DEFAULT 'draft', -- draft, processing, completed, failed, finalized
+    timings JSONB, -- Per-node timing breakdown of the graph run (see metrics.py)
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -53,14 +73,56 @@ CREATE TABLE quotation_items (
     price_list_id UUID REFERENCES price_lists(id) ON DELETE SET NULL, -- Nullable if custom item
     description TEXT NOT NULL, -- Copied from price list or custom
     quantity NUMERIC(10, 2) NOT NULL DEFAULT 1, -- Can be area, count etc.
+    unit VARCHAR(50),
+    location VARCHAR(255), -- Room/area from the transcript
     unit_price NUMERIC(10, 2) NOT NULL,
     subtotal NUMERIC(12, 2) GENERATED ALWAYS AS (quantity * unit_price) STORED,
     confidence_score FLOAT, -- Match confidence
     is_suspense BOOLEAN DEFAULT FALSE, -- If true, needs review
+    best_matches JSONB, -- Top candidates [{text, score, id}] for suspense items
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Quotation Jobs Table (Work Queue, claimed by worker.py with FOR UPDATE SKIP LOCKED)
+CREATE TABLE quotation_jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    quotation_id UUID REFERENCES quotations(id) ON DELETE CASCADE,
+    tenant_id UUID REFERENCES tenants(id) ON DELETE CASCADE,
+    transcript TEXT NOT NULL,
+    property_type VARCHAR(50), -- Optional matcher filter (HDB, Condo, Landed)
+    profile BOOLEAN NOT NULL DEFAULT FALSE, -- Run under the sampling profiler (see profiling.py)
+    status VARCHAR(50) NOT NULL DEFAULT 'queued', -- queued, running, done, failed
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    run_after TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP, -- Retry backoff
+    locked_at TIMESTAMP WITH TIME ZONE, -- Lease start, renewed by the worker's heartbeat
+    lease_token UUID, -- New per claim; a worker whose lease expired can no longer complete or fail the job
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- LLM Result Cache (guard verdicts / extracted items, keyed by content hash)
+CREATE TABLE llm_cache (
+    cache_key CHAR(64) PRIMARY KEY, -- sha256 of (kind, model, prompt version, normalized input)
+    kind VARCHAR(50) NOT NULL, -- guard, extractor
+    model VARCHAR(100),
+    prompt_version VARCHAR(50),
+    value JSONB NOT NULL,
+    hit_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP, -- TTL is measured from here
+    last_hit_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP -- Size-based eviction drops the oldest first
+);
+
 -- Indexes for performance
 CREATE INDEX idx_price_lists_tenant ON price_lists(tenant_id);
 CREATE INDEX idx_product_aliases_text ON product_aliases(alias_text);
 CREATE INDEX idx_product_aliases_tenant ON product_aliases(tenant_id);
+CREATE INDEX idx_quotation_jobs_queued ON quotation_jobs(run_after) WHERE status = 'queued';
+CREATE INDEX idx_llm_cache_last_hit ON llm_cache(last_hit_at);
+CREATE INDEX idx_quotation_jobs_running ON quotation_jobs(locked_at) WHERE status = 'running';
+CREATE INDEX idx_price_lists_variant ON price_lists(tenant_id, property_type, area) WHERE is_active;
+
+-- Trigram indexes for the pg_trgm matcher backend (MATCHER_BACKEND=pg_trgm)
+CREATE INDEX idx_price_lists_description_trgm ON price_lists USING gin (tenant_id, description gin_trgm_ops);
+CREATE INDEX idx_product_aliases_text_trgm ON product_aliases USING gin (tenant_id, alias_text gin_trgm_ops);
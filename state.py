@@ -1,4 +1,4 @@
-from typing import List, Optional, TypedDict, Dict, Any
+from typing import Annotated, List, Optional, TypedDict, Dict, Any
 from pydantic import BaseModel, Field
 
 # Pydantic models for structured validation within the state
@@ -22,8 +22,11 @@ class ExtractedItem(BaseModel):
 
 class SuspenseItem(BaseModel):
     raw_text: str
-    best_matches: List[Dict[str, Any]] # List of {text, score, id}
+    best_matches: List[Dict[str, Any]] # List of {text, score, id, property_type, area}
     confidence_score: float
+    quantity: float = 1.0
+    unit: Optional[str] = None
+    location: Optional[str] = None
 
 class Quotation(BaseModel):
     tenant_id: str
@@ -31,12 +34,17 @@ class Quotation(BaseModel):
     items: List[QuotationItem] = []
     total_amount: float = 0.0
 
+def merge_timings(left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reducer for per-node timing entries; parallel nodes each add their own key."""
+    return {**(left or {}), **(right or {})}
+
 # LangGraph State
 class RenovationState(TypedDict):
     # Input
     raw_items: List[ExtractedItem] # Extracted structured items from user input/LLM
     tenant_id: str
     session_id: str
+    property_type: Optional[str] # HDB / Condo / Landed, narrows matching when known
     
     # Processing
     matched_items: List[QuotationItem]
@@ -46,3 +54,4 @@ class RenovationState(TypedDict):
     quotation: Optional[Quotation]
     validation_errors: List[str] # Warnings/Errors found during processing
     error: Optional[str] # Fatal error (e.g. security violation)
+    timings: Annotated[Dict[str, Any], merge_timings] # Per-node timing breakdown (see metrics.py)
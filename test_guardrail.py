@@ -1,19 +1,18 @@
-import os
 import sys
 import uuid
-import psycopg2
 from dotenv import load_dotenv
-from graph import build_graph
+from graph import get_graph
+from db import get_connection
 
 load_dotenv()
 
 def get_tenant_id(tenant_name="Homeez"):
     try:
-        conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM tenants WHERE name = %s", (tenant_name,))
-        res = cur.fetchone()
-        conn.close()
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT id FROM tenants WHERE name = %s", (tenant_name,))
+            res = cur.fetchone()
+            cur.close()
         if res:
             return str(res[0])
     except Exception as e:
@@ -23,7 +22,7 @@ def get_tenant_id(tenant_name="Homeez"):
 def test_guardrail():
     print("🚀 STARTING GUARDRAIL TESTS...")
     
-    app = build_graph()
+    app = get_graph()
     tenant_id = get_tenant_id()
     
     # 1. TEST INJECTION (Should Fail)
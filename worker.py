@@ -0,0 +1,152 @@
+import argparse
+import os
+import signal
+import threading
+import time
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+from db import get_connection, close_pool
+from job_queue import claim_job, complete_job, fail_job, renew_leases, requeue_stale_jobs, JOB_HEARTBEAT_SECONDS
+from processing import run_quotation_graph, save_quotation_result
+from metrics import start_metrics_server, METRICS_PORT
+from profiling import profiled
+
+load_dotenv()
+
+# Quotation worker: claims jobs queued by POST /quotation and runs the graph.
+# Scale by running more processes and/or raising --concurrency.
+#
+#   python worker.py --concurrency 4
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "1"))
+
+stop_event = threading.Event()
+
+# Lease tokens of the jobs this process is running, kept alive by heartbeat_loop
+in_flight = set()
+in_flight_lock = threading.Lock()
+
+
+def process_job(job):
+    quotation_id = str(job['quotation_id'])
+    print(f"Processing quotation {quotation_id} (attempt {job['attempts']}/{job['max_attempts']})...")
+    with in_flight_lock:
+        in_flight.add(job['lease_token'])
+    try:
+        with profiled(quotation_id, job.get('profile')):
+            result = run_quotation_graph(job['transcript'], job['tenant_id'], job.get('property_type'))
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                # Lease check first: a run that was given up on must not overwrite the new one's items
+                if not complete_job(cur, job):
+                    conn.rollback()
+                    print(f"Lease on quotation {quotation_id} was lost; discarding this run's result.")
+                    return
+                save_quotation_result(cur, quotation_id, result)
+            conn.commit()
+        print(f"Quotation {quotation_id} processed successfully.")
+    except Exception as e:
+        print(f"Error processing quotation {quotation_id}: {e}")
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cur:
+                    retried = fail_job(cur, job, str(e))
+                conn.commit()
+        except Exception as db_error:
+            # The reaper re-queues the job once its lease expires
+            print(f"Could not record failure of quotation {quotation_id}: {db_error}")
+            return
+        if not retried and job['attempts'] < job['max_attempts']:
+            print(f"Lease on quotation {quotation_id} was lost; the run that took over owns it.")
+        elif not retried:
+            print(f"Quotation {quotation_id} failed after {job['attempts']} attempts.")
+    finally:
+        with in_flight_lock:
+            in_flight.discard(job['lease_token'])
+
+
+def worker_loop(worker_id: int):
+    while not stop_event.is_set():
+        try:
+            with get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    job = claim_job(cur)
+                conn.commit()
+        except Exception as e:
+            print(f"[worker {worker_id}] Could not claim job: {e}")
+            job = None
+
+        if job is None:
+            stop_event.wait(WORKER_POLL_SECONDS)
+            continue
+
+        try:
+            process_job(job)
+        except Exception as e:
+            # Never let one job (or a DB blip) take this worker thread down
+            print(f"[worker {worker_id}] Unexpected error on job {job['id']}: {e}")
+
+
+def reaper_loop():
+    """Periodically re-queues jobs abandoned by crashed workers."""
+    while not stop_event.is_set():
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cur:
+                    recovered = requeue_stale_jobs(cur)
+                conn.commit()
+            if recovered:
+                print(f"Recovered {recovered} stale job(s).")
+        except Exception as e:
+            print(f"Reaper error: {e}")
+        stop_event.wait(max(WORKER_POLL_SECONDS, 30))
+
+
+def heartbeat_loop():
+    """Renews the leases of in-flight jobs so long runs are not re-queued by a reaper."""
+    while not stop_event.wait(JOB_HEARTBEAT_SECONDS):
+        with in_flight_lock:
+            tokens = list(in_flight)
+        if not tokens:
+            continue
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cur:
+                    held = renew_leases(cur, tokens)
+                conn.commit()
+            if held < len(tokens):
+                print(f"{len(tokens) - held} in-flight job lease(s) already expired.")
+        except Exception as e:
+            print(f"Heartbeat error: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quotation job worker")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY,
+                        help="Jobs processed in parallel by this process")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="Serve Prometheus metrics on this port (0 = off)")
+    args = parser.parse_args()
+    start_metrics_server(args.metrics_port)
+
+    def handle_signal(signum, frame):
+        print("Shutting down after in-flight jobs finish...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    threads = [threading.Thread(target=reaper_loop, daemon=True), threading.Thread(target=heartbeat_loop, daemon=True)]
+    threads += [threading.Thread(target=worker_loop, args=(i,)) for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    print(f"Worker started with concurrency {args.concurrency}.")
+
+    while any(t.is_alive() for t in threads[2:]):
+        time.sleep(0.5)
+    close_pool()
+
+
+if __name__ == "__main__":
+    main()